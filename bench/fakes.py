@@ -0,0 +1,576 @@
+import asyncio
+import csv
+import logging
+import operator
+import re
+from collections import Counter
+from contextlib import contextmanager
+from io import StringIO
+from itertools import count
+from types import SimpleNamespace
+
+from psycopg2 import IntegrityError
+from pypika import PostgreSQLQuery
+
+from fresnel.core.metrics import MetricsRegistry
+from fresnel.core.startup import StartupTracer
+
+
+log = logging.getLogger(__name__)
+
+CREATE_MATCH = re.compile(
+    r'\s*CREATE TABLE IF NOT EXISTS "([^"]+)" \((.*)\)\s*$', re.S,
+)
+COLUMN_MATCH = re.compile(r'^\s*(\w+) ', re.M)
+DROP_MATCH = re.compile(r'DROP TABLE "([^"]+)"$')
+SELECT_MATCH = re.compile(
+    r'SELECT (.+?) FROM "([^"]+)"(?: WHERE (.+?))?'
+    r'(?: ORDER BY "(\w+)")?(?: LIMIT (\d+))?$'
+)
+CONDITION_MATCH = re.compile(
+    r'"(\w+)"(?: IN \(([^)]*)\)|(>=|<=|>|<|=)(-?\d+))$'
+)
+COMPARE = {
+    '>=': operator.ge,
+    '<=': operator.le,
+    '>': operator.gt,
+    '<': operator.lt,
+    '=': operator.eq,
+}
+INSERT_MATCH = re.compile(
+    r'INSERT INTO "([^"]+)" VALUES (.*?)( ON CONFLICT DO NOTHING)?$'
+)
+ROW_MATCH = re.compile(r'\(([^)]*)\)')
+UPDATE_MATCH = re.compile(
+    r'UPDATE "([^"]+)" SET "(\w+)"=(-?\d+) WHERE "\w+"=(-?\d+)$'
+)
+DELETE_MATCH = re.compile(r'DELETE FROM "([^"]+)" WHERE (.*)$')
+KEY_MATCH = re.compile(r'=(-?\d+)')
+# hand-written keyset and count queries, matched with whitespace collapsed
+KEYSET_MATCH = re.compile(
+    r'SELECT (count\(\*\)(?: \+ 1)?|\w+(?:, \w+)*) FROM "([^"]+)"'
+    r'(?: WHERE \(([\w, ]+)\) ([<>]) \(([-\d, ]+)\))?'
+    r'(?: ORDER BY ([\w, ]+?))?(?: LIMIT (-?\d+))?$'
+)
+WRITES = frozenset(('INSERT', 'UPDATE', 'DELETE', 'TRUNCATE'))
+
+
+class FakeConfig(dict):
+    def get(self, key, default=None, comment=None):
+        return super().get(key, default)
+
+
+class Latency:
+    """Simulated round trip times in seconds, by backend."""
+
+    def __init__(self, db=0.001, redis=0.0005, rest=0.05):
+        self.db = db
+        self.redis = redis
+        self.rest = rest
+
+
+class FakeDatabase:
+    """An in-memory stand-in for the handful of statements cogs issue.
+
+    Every table is keyed on its first column, which holds for all of
+    fresnel's schemas. Every write bumps the snapshot generation, as the
+    triggers on snapshotted tables do.
+    """
+
+    def __init__(self, latency: Latency):
+        self.latency = latency
+        self.tables = {}
+        self.columns = {}
+        self.oids = {}
+        self.next_oid = count(16384)
+        self.generation = 0
+        self.statements = Counter()
+
+    def seed(self, name: str, columns, rows):
+        self.columns[name] = tuple(columns)
+        self.tables[name] = {row[0]: tuple(row) for row in rows}
+        self.oids.setdefault(name, next(self.next_oid))
+
+    def acquire(self):
+        return FakeConnection(self)
+
+    def run(self, sql: str):
+        sql = sql.strip()
+        verb = sql.split(None, 1)[0].upper()
+        self.statements[verb] += 1
+        if verb in WRITES:
+            self.generation += 1
+
+        if verb == 'SELECT' and 'fresnel_snapshot_generation' in sql:
+            return [(
+                self.generation, len(self.tables), sum(self.oids.values()),
+            )]
+
+        match = KEYSET_MATCH.match(' '.join(sql.split()))
+        if match:
+            return self._keyset(*match.groups())
+
+        match = CREATE_MATCH.match(sql)
+        if match:
+            name = match.group(1)
+            self.columns.setdefault(name, tuple(
+                column
+                for column
+                in COLUMN_MATCH.findall(match.group(2))
+                if column != 'PRIMARY'
+            ))
+            self.tables.setdefault(name, {})
+            self.oids.setdefault(name, next(self.next_oid))
+            return []
+
+        match = DROP_MATCH.match(sql)
+        if match:
+            self.tables.pop(match.group(1), None)
+            self.columns.pop(match.group(1), None)
+            self.oids.pop(match.group(1), None)
+            return []
+
+        match = SELECT_MATCH.match(sql)
+        if match:
+            name = match.group(2)
+            columns = self.columns[name]
+            indices = [
+                columns.index(column.strip().strip('"'))
+                for column
+                in match.group(1).split(',')
+            ]
+            rows = list(self.tables[name].values())
+            if match.group(3):
+                for condition in match.group(3).split(' AND '):
+                    column, keys, op, value = CONDITION_MATCH.match(
+                        condition
+                    ).groups()
+                    column = columns.index(column)
+                    if keys is not None:
+                        keys = {int(key) for key in keys.split(',')}
+                        rows = [row for row in rows if row[column] in keys]
+                    else:
+                        compare = COMPARE[op]
+                        rows = [
+                            row for row in rows
+                            if compare(row[column], int(value))
+                        ]
+            if match.group(4):
+                column = columns.index(match.group(4))
+                rows.sort(key=lambda row: row[column])
+            if match.group(5):
+                rows = rows[:int(match.group(5))]
+            return [
+                tuple(row[index] for index in indices)
+                for row
+                in rows
+            ]
+
+        match = INSERT_MATCH.match(sql)
+        if match:
+            table = self.tables[match.group(1)]
+            rows = [
+                tuple(int(value) for value in values.split(','))
+                for values
+                in ROW_MATCH.findall(match.group(2))
+            ]
+            if match.group(3):
+                rows = [row for row in rows if row[0] not in table]
+            for row in rows:
+                if row[0] in table:
+                    raise IntegrityError(
+                        f"duplicate key {row[0]} in {match.group(1)}"
+                    )
+            table.update((row[0], row) for row in rows)
+            return []
+
+        match = UPDATE_MATCH.match(sql)
+        if match:
+            name, column, value, key = match.groups()
+            table = self.tables[name]
+            row = table.get(int(key))
+            if row is not None:
+                row = list(row)
+                row[self.columns[name].index(column)] = int(value)
+                table[int(key)] = tuple(row)
+            return []
+
+        match = DELETE_MATCH.match(sql)
+        if match:
+            table = self.tables[match.group(1)]
+            for key in KEY_MATCH.findall(match.group(2)):
+                table.pop(int(key), None)
+            return []
+
+        log.debug(f"fake database ignoring statement: {sql[:80]}")
+        return []
+
+    def _keyset(self, select, name, where, op, bound, order, limit):
+        columns = self.columns[name]
+        rows = list(self.tables[name].values())
+
+        if where:
+            indices = [columns.index(c.strip()) for c in where.split(',')]
+            bound = tuple(int(value) for value in bound.split(','))
+            compare = COMPARE[op]
+            rows = [
+                row for row in rows
+                if compare(tuple(row[index] for index in indices), bound)
+            ]
+        if order:
+            terms = [term.split() for term in order.split(',')]
+            indices = [columns.index(term[0]) for term in terms]
+            rows.sort(
+                key=lambda row: tuple(row[index] for index in indices),
+                reverse=terms[0][-1] == 'DESC',
+            )
+        if limit:
+            rows = rows[:max(0, int(limit))]
+
+        if select.startswith('count'):
+            return [(len(rows) + select.endswith('+ 1'),)]
+        indices = [columns.index(column) for column in select.split(', ')]
+        return [tuple(row[index] for index in indices) for row in rows]
+
+
+class FakeConnection:
+    def __init__(self, db: FakeDatabase):
+        self.db = db
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    def cursor(self):
+        return FakeCursor(self.db)
+
+
+def _literal(value):
+    if value is None:
+        return 'NULL'
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    return str(int(value))
+
+
+class FakeCursor:
+    def __init__(self, db: FakeDatabase):
+        self.db = db
+        self.rows = iter(())
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    async def execute(self, sql: str, parameters=None):
+        await asyncio.sleep(self.db.latency.db)
+        if parameters is not None:
+            # bound client side, as psycopg2 does
+            sql = sql % tuple(_literal(value) for value in parameters)
+        self.rows = iter(self.db.run(sql))
+
+    async def fetchone(self):
+        return next(self.rows, None)
+
+    async def fetchall(self):
+        return list(self.rows)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self.rows)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class FakeRedis:
+    """Just enough of an aioredis pool for PrefixManager and snapshots."""
+
+    def __init__(self, latency: Latency):
+        self.latency = latency
+        self.hashes = {}
+        self.counters = Counter()
+        self.commands = Counter()
+
+    def seed_prefixes(self, key: str, prefixes: dict):
+        rows = self.hashes.setdefault(key, {})
+        for guild_id, values in prefixes.items():
+            row = StringIO()
+            csv.writer(row).writerow(values)
+            rows[str(guild_id)] = row.getvalue()
+
+    async def _command(self, name: str):
+        self.commands[name] += 1
+        await asyncio.sleep(self.latency.redis)
+
+    def __await__(self):
+        return self._acquire().__await__()
+
+    async def _acquire(self):
+        return FakeRedisConnection(self)
+
+    async def hgetall(self, key):
+        await self._command('HGETALL')
+        return dict(self.hashes.get(key, {}))
+
+    async def hset(self, key, field, value):
+        await self._command('HSET')
+        self.hashes.setdefault(key, {})[str(field)] = value
+
+    async def hdel(self, key, field):
+        await self._command('HDEL')
+        self.hashes.get(key, {}).pop(str(field), None)
+
+    async def get(self, key):
+        await self._command('GET')
+        value = self.counters.get(key)
+        return None if value is None else str(value)
+
+    async def incr(self, key):
+        await self._command('INCR')
+        self.counters[key] += 1
+        return self.counters[key]
+
+    def multi_exec(self):
+        return FakeTransaction(self)
+
+
+class FakeRedisConnection:
+    def __init__(self, redis: FakeRedis):
+        self.redis = redis
+
+    def __enter__(self):
+        return self.redis
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+class FakeTransaction:
+    def __init__(self, redis: FakeRedis):
+        self.redis = redis
+        self.fields = []
+        self.counters = []
+
+    def hdel(self, key, field):
+        self.fields.append((key, field))
+
+    def incr(self, key):
+        self.counters.append(key)
+
+    async def execute(self):
+        await self.redis._command('MULTI')
+        for key, field in self.fields:
+            self.redis.hashes.get(key, {}).pop(str(field), None)
+        for key in self.counters:
+            self.redis.counters[key] += 1
+
+
+class FakeRole:
+    def __init__(self, guild, role_id: int, name: str, position: int):
+        self.guild = guild
+        self.id = role_id
+        self.name = name
+        self.position = position
+
+    def __repr__(self):
+        return f'<FakeRole id={self.id} name={self.name!r}>'
+
+    def __str__(self):
+        return self.name
+
+    @property
+    def mention(self):
+        return f'<@&{self.id}>'
+
+    def is_default(self):
+        return self.id == self.guild.id
+
+
+class FakeMember:
+    def __init__(self, guild, member_id: int, bot: bool, roles):
+        self.guild = guild
+        self.id = member_id
+        self.bot = bot
+        self.name = f'user{member_id}'
+        self.avatar_url = ''
+        self.roles = roles
+
+    def __repr__(self):
+        return f'<FakeMember id={self.id}>'
+
+    @property
+    def mention(self):
+        return f'<@{self.id}>'
+
+    def copy(self):
+        return FakeMember(self.guild, self.id, self.bot, list(self.roles))
+
+    async def add_roles(self, *roles, reason=None):
+        await self.guild.rest.call('add_roles')
+        self.roles = self.roles + [
+            role for role in roles if role not in self.roles
+        ]
+
+    async def remove_roles(self, *roles, reason=None):
+        await self.guild.rest.call('remove_roles')
+        self.roles = [role for role in self.roles if role not in roles]
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int, rest):
+        self.id = guild_id
+        self.name = f'guild{guild_id}'
+        self.rest = rest
+        self._roles = {guild_id: FakeRole(self, guild_id, '@everyone', 0)}
+        self._members = {}
+
+    def __repr__(self):
+        return f'<FakeGuild id={self.id}>'
+
+    @property
+    def default_role(self):
+        return self._roles[self.id]
+
+    @property
+    def roles(self):
+        return sorted(self._roles.values(), key=lambda role: role.position)
+
+    @property
+    def members(self):
+        return list(self._members.values())
+
+    @property
+    def member_count(self):
+        return len(self._members)
+
+    def get_role(self, role_id):
+        return self._roles.get(role_id)
+
+    def get_member(self, member_id):
+        return self._members.get(member_id)
+
+    def add_role(self, role_id: int, name: str, position: int):
+        self._roles[role_id] = role = FakeRole(self, role_id, name, position)
+        return role
+
+    def remove_role(self, role_id: int):
+        role = self._roles.pop(role_id, None)
+        if role is not None:
+            for member in self._members.values():
+                if role in member.roles:
+                    member.roles = [r for r in member.roles if r is not role]
+        return role
+
+    def add_member(self, member_id: int, bot: bool, role_ids=()):
+        roles = [self.default_role] + [
+            self._roles[role_id]
+            for role_id
+            in role_ids
+            if role_id in self._roles
+        ]
+        self._members[member_id] = member = FakeMember(
+            self, member_id, bot, roles,
+        )
+        return member
+
+    def remove_member(self, member_id: int):
+        return self._members.pop(member_id, None)
+
+
+class FakeMessage:
+    def __init__(self, message_id: int, guild, channel_id: int, author,
+                 content: str):
+        self.id = message_id
+        self.guild = guild
+        self.channel = SimpleNamespace(id=channel_id, guild=guild)
+        self.author = author
+        self.content = content
+        self.mentions = []
+
+
+class FakeREST:
+    """Counts REST calls and charges a fixed latency for each."""
+
+    def __init__(self, latency: Latency):
+        self.latency = latency
+        self.calls = Counter()
+
+    async def call(self, route: str):
+        self.calls[route] += 1
+        await asyncio.sleep(self.latency.rest)
+
+
+class FakeCompute:
+    """Runs compute jobs inline, so timings include them."""
+
+    async def run(self, fn, *args, size=None):
+        return fn(*args)
+
+
+class FakeScheduler:
+    """Runs timers as tasks, keeping track of those still outstanding."""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.pending = set()
+
+    def time(self):
+        return self.loop.time()
+
+    def call_later(self, delay: float, callback, *args):
+        task = self.loop.create_task(self._later(delay, callback, args))
+        self.pending.add(task)
+        task.add_done_callback(self.pending.discard)
+        return task
+
+    def cancel(self, handle):
+        handle.cancel()
+
+    async def _later(self, delay: float, callback, args):
+        await asyncio.sleep(delay)
+        result = callback(*args)
+        if asyncio.iscoroutine(result):
+            await result
+
+
+class FakeRESTScheduler:
+    @contextmanager
+    def background(self):
+        yield
+
+
+class FakeBot:
+    def __init__(self, user_id: int, latency: Latency, config=None):
+        self.loop = asyncio.get_event_loop()
+        self.user = SimpleNamespace(id=user_id, mention=f'<@{user_id}>')
+        self.latency = latency
+        self._guilds = {}
+        self.command_prefix = ','
+        self._config = FakeConfig(config or {})
+        self.metrics = MetricsRegistry()
+        self.startup_trace = StartupTracer(False)
+        self.rest = FakeREST(latency)
+        self.compute = FakeCompute()
+        self.scheduler = FakeScheduler(self.loop)
+        self.rest_scheduler = FakeRESTScheduler()
+        self._db_pool = FakeDatabase(latency)
+        self._db_Query = PostgreSQLQuery
+        self.redis_pool = FakeRedis(latency)
+
+    @property
+    def guilds(self):
+        return list(self._guilds.values())
+
+    def get_guild(self, guild_id):
+        return self._guilds.get(guild_id)
+
+    def add_guild(self, guild_id: int):
+        self._guilds[guild_id] = guild = FakeGuild(guild_id, self.rest)
+        return guild
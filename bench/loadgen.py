@@ -0,0 +1,372 @@
+import argparse
+import asyncio
+import csv
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+from io import StringIO
+
+import aiopg
+import aioredis
+
+from bench.fakes import FakeBot, Latency
+from cogs.autoroles import ROLE_SCHEMA, THZ_INDEX, THZ_SCHEMA, AutoRoles
+from cogs.prefix import KEY_NAME, PrefixManager
+from cogs.selfroles import SCHEMA as SELFROLE_SCHEMA, SelfRoles
+from fresnel.core.cache import CacheManager
+
+
+GUILD_BASE = 700000000000000000
+ROLE_BASE = 800000000000000000
+MEMBER_BASE = 900000000000000000
+INSERT_CHUNK = 1000
+
+
+def member_count(index: int, largest: int, skew: float):
+    # Zipf-like: a few huge guilds and a long tail of small ones
+    return max(1, int(largest / (index + 1) ** skew))
+
+
+def generate_guild(index: int, largest: int, skew: float, roles: int,
+                   drift: float):
+    guild_id = GUILD_BASE + index
+    rng = random.Random(guild_id)
+
+    role_ids = [ROLE_BASE + index * 1000 + offset for offset in range(roles)]
+    autoroles = [
+        (role_id, level * level * 100)
+        for level, role_id
+        in enumerate(role_ids[:roles // 2])
+    ]
+    selfroles = role_ids[roles // 2:]
+    thresholds = [thz for _, thz in autoroles]
+
+    members = []
+    for offset in range(member_count(index, largest, skew)):
+        thz = int((rng.paretovariate(1.16) - 1) * 100)
+        member_roles = rng.sample(selfroles, min(len(selfroles),
+                                                 rng.randint(0, 2)))
+        # most members already hold the autorole their THz maps to
+        if autoroles and rng.random() >= drift:
+            level = sum(1 for value in thresholds if value <= thz) - 1
+            if level >= 0:
+                member_roles.append(autoroles[level][0])
+        members.append((MEMBER_BASE + offset, thz, member_roles))
+
+    prefixes = None
+    if rng.random() < 0.3:
+        prefixes = rng.choice((['!'], ['?', '$'], ['f.', 'fresnel ']))
+
+    return {
+        'id': guild_id,
+        'roles': role_ids,
+        'autoroles': autoroles,
+        'selfroles': selfroles,
+        'members': members,
+        'prefixes': prefixes,
+    }
+
+
+def generate(args, guilds: int):
+    return [
+        generate_guild(index, args.members, args.skew, args.roles, args.drift)
+        for index
+        in range(guilds)
+    ]
+
+
+async def _insert(cur, name: str, rows):
+    for start in range(0, len(rows), INSERT_CHUNK):
+        values = ','.join(
+            '(' + ','.join(str(int(value)) for value in row) + ')'
+            for row
+            in rows[start:start + INSERT_CHUNK]
+        )
+        await cur.execute(f'INSERT INTO "{name}" VALUES {values}')
+
+
+async def populate_tables(pool, specs):
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            for spec in specs:
+                guild_id = spec['id']
+                for schema, name, rows in (
+                        (ROLE_SCHEMA, f'autoroles-{guild_id}',
+                         spec['autoroles']),
+                        (THZ_SCHEMA, f'thz-{guild_id}',
+                         [(user_id, thz)
+                          for user_id, thz, _ in spec['members']]),
+                        (SELFROLE_SCHEMA, f'selfroles-{guild_id}',
+                         [(role_id,) for role_id in spec['selfroles']]),
+                ):
+                    await cur.execute(schema.format(name=name))
+                    await cur.execute(f'TRUNCATE "{name}"')
+                    await _insert(cur, name, rows)
+                # built here so startup timings don't include it
+                await cur.execute(THZ_INDEX.format(name=f'thz-{guild_id}'))
+
+
+async def drop_tables(pool, guilds: int):
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            for index in range(guilds):
+                guild_id = GUILD_BASE + index
+                for name in (f'autoroles-{guild_id}', f'thz-{guild_id}',
+                             f'selfroles-{guild_id}'):
+                    await cur.execute(f'DROP TABLE IF EXISTS "{name}"')
+
+
+async def populate_prefixes(redis, specs):
+    await redis.delete(KEY_NAME)
+    rows = {}
+    for spec in specs:
+        if spec['prefixes']:
+            row = StringIO()
+            csv.writer(row).writerow(spec['prefixes'])
+            rows[str(spec['id'])] = row.getvalue()
+    if rows:
+        await redis.hmset_dict(KEY_NAME, rows)
+
+
+def rss():
+    """Resident set size of this process in bytes."""
+
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        # ru_maxrss is the peak, in KiB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+async def connect(args):
+    pool = await aiopg.create_pool(args.dsn)
+    host, _, rest = args.redis.partition(':')
+    port, _, db = rest.partition('/')
+    redis = await aioredis.create_redis_pool(
+        (host, int(port or 6379)), db=int(db or 0), encoding='utf-8',
+    )
+    return pool, redis
+
+
+async def startup(args):
+    specs = generate(args, args.guilds)
+    pool, redis = await connect(args)
+    await populate_prefixes(redis, specs)
+
+    bot = FakeBot(1, Latency(rest=args.rest_latency / 1000))
+    bot._db_pool = pool
+    bot.redis_pool = redis
+    for spec in specs:
+        guild = bot.add_guild(spec['id'])
+        for position, role_id in enumerate(spec['roles'], start=1):
+            guild.add_role(role_id, f'role {position}', position)
+        for user_id, _, role_ids in spec['members']:
+            guild.add_member(user_id, False, role_ids)
+
+    rss_gateway = rss()
+    timings = {}
+
+    async def init(name, cog):
+        start = time.perf_counter()
+        await cog._init()
+        timings[name] = time.perf_counter() - start
+
+    # mirror the dependency graph: role_cache gates selfroles/autoroles
+    start = time.perf_counter()
+    cache = CacheManager(bot)
+    await asyncio.gather(
+        init('cache', cache),
+        init('prefix', PrefixManager(bot)),
+    )
+    autoroles = AutoRoles(bot)
+    await asyncio.gather(
+        init('selfroles', SelfRoles(bot)),
+        init('autoroles', autoroles),
+    )
+    ready = time.perf_counter() - start
+    autoroles.ptask.cancel()
+
+    # the largest guild's leaderboard and a rank served from PostgreSQL,
+    # as thz_leaderboard_sql does
+    start = time.perf_counter()
+    largest = bot.get_guild(specs[0]['id'])
+    pages = await autoroles._sql_leaderboard(largest)
+    await pages.fetch(len(pages) - 1)
+    user_id, thz, _ = specs[0]['members'][-1]
+    await autoroles._sql_rank(largest.id, user_id, thz)
+    timings['leaderboard'] = time.perf_counter() - start
+
+    redis.close()
+    await redis.wait_closed()
+    pool.close()
+    await pool.wait_closed()
+
+    return {
+        'guilds': args.guilds,
+        'largest': args.members,
+        'members': sum(len(spec['members']) for spec in specs),
+        'ready': ready,
+        'timings': timings,
+        'rss_gateway': rss_gateway,
+        'rss_ready': rss(),
+        'rest_calls': sum(bot.rest.calls.values()),
+    }
+
+
+async def populate(args, guilds: int):
+    pool, redis = await connect(args)
+    await populate_tables(pool, generate(args, guilds))
+    redis.close()
+    await redis.wait_closed()
+    pool.close()
+    await pool.wait_closed()
+
+
+async def drop(args, guilds: int):
+    pool, redis = await connect(args)
+    await drop_tables(pool, guilds)
+    await redis.delete(KEY_NAME)
+    redis.close()
+    await redis.wait_closed()
+    pool.close()
+    await pool.wait_closed()
+
+
+def _common(args):
+    return [
+        '--dsn', args.dsn,
+        '--redis', args.redis,
+        '--skew', str(args.skew),
+        '--roles', str(args.roles),
+        '--drift', str(args.drift),
+        '--rest-latency', str(args.rest_latency),
+    ]
+
+
+def curve(args):
+    loop = asyncio.get_event_loop()
+    points = []
+    guild_counts = sorted(args.guild_counts)
+
+    print(f"{'largest':>8} {'guilds':>7} {'members':>9} {'ready':>9} "
+          f"{'cache':>8} {'prefix':>8} {'selfrl':>8} {'autorl':>8} "
+          f"{'lb':>8} {'rss MiB':>8} {'+ MiB':>7}", flush=True)
+    for largest in sorted(args.member_counts):
+        args.members = largest
+        loop.run_until_complete(populate(args, guild_counts[-1]))
+
+        for guilds in guild_counts:
+            # a fresh interpreter per point keeps the RSS readings honest
+            output = subprocess.run(
+                [
+                    sys.executable, '-m', 'bench.loadgen', 'startup',
+                    '--guilds', str(guilds), '--members', str(largest),
+                ] + _common(args),
+                stdout=subprocess.PIPE, check=True,
+            ).stdout
+            point = json.loads(output)
+            points.append(point)
+
+            timings = point['timings']
+            growth = point['rss_ready'] - point['rss_gateway']
+            print(
+                f"{largest:>8} {guilds:>7} {point['members']:>9} "
+                f"{point['ready']:>8.2f}s "
+                f"{timings['cache']:>7.2f}s {timings['prefix']:>7.2f}s "
+                f"{timings['selfroles']:>7.2f}s "
+                f"{timings['autoroles']:>7.2f}s "
+                f"{timings['leaderboard']:>7.2f}s "
+                f"{point['rss_ready'] / 2 ** 20:>8.1f} "
+                f"{growth / 2 ** 20:>7.1f}",
+                flush=True,
+            )
+
+    if not args.keep:
+        loop.run_until_complete(drop(args, guild_counts[-1]))
+    return points
+
+
+def _counts(value: str):
+    return [int(count) for count in value.split(',')]
+
+
+common = argparse.ArgumentParser(add_help=False)
+common.add_argument(
+    '--dsn', required=True,
+    help="libpq connection string of a scratch PostgreSQL database",
+)
+common.add_argument(
+    '--redis', required=True, metavar='HOST:PORT/DB',
+    help="scratch Redis database; its prefixes hash is overwritten",
+)
+common.add_argument(
+    '--skew', type=float, default=1.0,
+    help="Zipf exponent of member counts over guilds",
+)
+common.add_argument(
+    '--roles', type=int, default=20,
+    help="roles per guild, half autoroles and half selfroles",
+)
+common.add_argument(
+    '--drift', type=float, default=0.05,
+    help="share of members not holding their expected autorole",
+)
+common.add_argument(
+    '--rest-latency', type=float, default=0.0, metavar='MS',
+    help="simulated Discord REST round trip",
+)
+
+parser = argparse.ArgumentParser(
+    prog='bench.loadgen',
+    description="measure startup time and memory on synthetic deployments",
+)
+commands = parser.add_subparsers(dest='command')
+
+curve_parser = commands.add_parser(
+    'curve', parents=[common],
+    help="populate the databases and measure startup over sizes",
+)
+curve_parser.add_argument(
+    '--guild-counts', type=_counts, default=[10, 100, 1000],
+    help="comma separated guild counts to measure",
+)
+curve_parser.add_argument(
+    '--member-counts', type=_counts, default=[1000, 10000],
+    help="comma separated member counts of the largest guild",
+)
+curve_parser.add_argument(
+    '--keep', action='store_true',
+    help="leave the generated tables in place afterwards",
+)
+curve_parser.add_argument(
+    '--json', type=argparse.FileType('w'), metavar='PATH',
+    help="also write every measured point to this file",
+)
+
+startup_parser = commands.add_parser(
+    'startup', parents=[common],
+    help="measure a single startup against populated databases",
+)
+startup_parser.add_argument('--guilds', type=int, required=True)
+startup_parser.add_argument('--members', type=int, required=True)
+
+
+def main(args):
+    if args.command == 'startup':
+        loop = asyncio.get_event_loop()
+        print(json.dumps(loop.run_until_complete(startup(args))))
+    elif args.command == 'curve':
+        points = curve(args)
+        if args.json:
+            json.dump(points, args.json, indent=2)
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main(parser.parse_args(sys.argv[1:]))
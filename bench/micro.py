@@ -0,0 +1,269 @@
+import argparse
+import json
+import platform
+import random
+import sys
+import timeit
+from itertools import product
+from pathlib import Path
+from types import SimpleNamespace
+
+from bench.fakes import FakeBot, FakeMessage, Latency
+from cogs.autoroles import AutoRoleCache, AutoRoles
+from cogs.prefix import KEY_NAME, PrefixManager
+from fresnel.core.cache import CacheManager
+from fresnel.core.util import EmbedPaginator
+
+
+BASELINE_PATH = Path(__file__).with_name('baselines.json')
+BENCHMARKS = []
+
+# snowflake-sized, so ID arguments take the same path as in production
+ROLE_ID = 600000000000000000
+
+
+def benchmark(**sizes):
+    """Register a benchmark run over every combination of ``sizes``."""
+
+    def decorator(fn):
+        names = tuple(sizes)
+        for values in product(*sizes.values()):
+            BENCHMARKS.append((fn, dict(zip(names, values))))
+        return fn
+    return decorator
+
+
+def key_for(fn, params: dict):
+    return fn.__name__ + '[' + ','.join(
+        f'{name}={value}' for name, value in params.items()
+    ) + ']'
+
+
+def _fake_bot():
+    return FakeBot(1, Latency(db=0, redis=0, rest=0))
+
+
+@benchmark(roles=(10, 100, 1000))
+def autorole_cache(roles):
+    rng = random.Random(roles)
+    cache = AutoRoleCache()
+    for index in range(roles):
+        cache.add_role(1000 + index, index * 100)
+
+    values = [rng.randrange(roles * 100) for _ in range(1000)]
+    role_sets = [
+        frozenset(rng.sample(range(1000, 1000 + roles), min(roles, 5)))
+        for _ in range(1000)
+    ]
+
+    def run():
+        for thz in values:
+            cache.get_nearest_role_id(thz)
+        for role_set in role_sets:
+            cache.find_highest_role_id(role_set)
+    return run
+
+
+@benchmark(roles=(10, 100, 1000), arguments=(1, 5))
+def convert_roles(roles, arguments):
+    rng = random.Random(roles)
+    bot = _fake_bot()
+    guild = bot.add_guild(1)
+    for index in range(roles):
+        guild.add_role(ROLE_ID + index, f'role name {index}', index + 1)
+
+    cache = CacheManager(bot)
+    bot.loop.run_until_complete(cache._init())
+    ctx = SimpleNamespace(message=SimpleNamespace(guild=guild))
+
+    queries = []
+    for _ in range(100):
+        parts = []
+        for index in rng.sample(range(roles), min(roles, arguments)):
+            parts.append(rng.choice((
+                f'"role name {index}"',
+                str(ROLE_ID + index),
+                f'<@&{ROLE_ID + index}>',
+            )))
+        queries.append(' '.join(parts))
+
+    def run():
+        for query in queries:
+            cache.convert_roles(ctx, query)
+    return run
+
+
+@benchmark(guilds=(10, 1000, 100000), prefixes=(1, 5))
+def get_prefix(guilds, prefixes):
+    rng = random.Random(guilds)
+    bot = _fake_bot()
+    for guild_id in range(1, guilds + 1):
+        bot.add_guild(guild_id)
+    bot.redis_pool.seed_prefixes(KEY_NAME, {
+        guild_id: [f'{index}!' for index in range(prefixes)]
+        for guild_id
+        in range(1, guilds + 1, 2)
+    })
+
+    manager = PrefixManager(bot)
+    bot.loop.run_until_complete(manager._init())
+    messages = [
+        FakeMessage(
+            index, bot.get_guild(rng.randint(1, guilds)), 1, None, '',
+        )
+        for index
+        in range(1000)
+    ]
+    get_prefix = bot.command_prefix
+
+    def run():
+        for message in messages:
+            get_prefix(bot, message)
+    return run
+
+
+@benchmark(lines=(100, 1000, 10000), length=(20, 80, 200))
+def embed_paginator(lines, length):
+    rng = random.Random(lines * length)
+    content = [
+        ''.join(rng.choice('abcdefghij ') for _ in range(length))
+        for _ in range(lines)
+    ]
+
+    def run():
+        pages = EmbedPaginator(None, "benchmark")
+        for line in content:
+            pages.add_line(line)
+        return pages.pages
+    return run
+
+
+@benchmark(members=(100, 10000, 100000))
+def user_ranks(members):
+    rng = random.Random(members)
+    cog = AutoRoles(_fake_bot())
+    cog._new_thz_cache(1).load(
+        (user_id, int(rng.paretovariate(1.2)))
+        for user_id
+        in range(members)
+    )
+
+    def run():
+        return cog._get_user_ranks(1)
+    return run
+
+
+@benchmark(members=(1000, 10000))
+def sql_leaderboard(members):
+    rng = random.Random(members)
+    bot = FakeBot(
+        1, Latency(db=0, redis=0, rest=0), {'thz_leaderboard_sql': True},
+    )
+    guild = bot.add_guild(1)
+    thz = {
+        user_id: int(rng.paretovariate(1.2))
+        for user_id
+        in range(members)
+    }
+    for user_id in range(0, members, 2):
+        guild.add_member(user_id, False)
+    bot._db_pool.seed('thz-1', ('user_id', 'thz'), thz.items())
+
+    cog = AutoRoles(bot)
+    ranks = rng.sample(sorted(thz.items()), 20)
+
+    async def browse():
+        # a fresh leaderboard paged from both ends, then some ranks
+        cog.leaderboards.clear()
+        cog.thz_totals.clear()
+        pages = await cog._sql_leaderboard(guild)
+        for index in (1, 2, len(pages) - 1, len(pages) - 2):
+            await pages.fetch(index)
+        for user_id, value in ranks:
+            await cog._sql_rank(1, user_id, value)
+
+    def run():
+        bot.loop.run_until_complete(browse())
+    return run
+
+
+def measure(run, repeat: int):
+    timer = timeit.Timer(run)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number
+
+
+def load_baselines():
+    try:
+        with BASELINE_PATH.open() as f:
+            return json.load(f).get('results', {})
+    except FileNotFoundError:
+        return {}
+
+
+def save_baselines(results: dict):
+    with BASELINE_PATH.open('w') as f:
+        json.dump({
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'results': results,
+        }, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+parser = argparse.ArgumentParser(
+    prog='bench.micro',
+    description="run offline microbenchmarks of fresnel's hot paths",
+)
+parser.add_argument(
+    '-k', '--filter', default='',
+    help="only run benchmarks whose name contains this text",
+)
+parser.add_argument(
+    '--repeat', type=int, default=5,
+    help="timing runs per benchmark, the fastest is kept",
+)
+parser.add_argument(
+    '--threshold', type=float, default=0.25,
+    help="slowdown over the baseline reported as a regression",
+)
+parser.add_argument(
+    '--save', action='store_true',
+    help="record these results as the new baselines",
+)
+
+
+def main(args):
+    baselines = load_baselines()
+    results = {}
+    regressions = []
+
+    for fn, params in BENCHMARKS:
+        key = key_for(fn, params)
+        if args.filter not in key:
+            continue
+
+        seconds = results[key] = measure(fn(**params), args.repeat)
+        line = f"{key:<48} {seconds * 1e6:>12.1f}us"
+
+        baseline = baselines.get(key)
+        if baseline:
+            change = seconds / baseline - 1
+            line += f" {change:>+8.1%}"
+            if change > args.threshold:
+                line += "  REGRESSION"
+                regressions.append(key)
+        print(line, flush=True)
+
+    if args.save:
+        save_baselines(dict(baselines, **results))
+        print(f"saved {len(results)} baselines to {BASELINE_PATH}")
+    elif regressions:
+        print(f"{len(regressions)} benchmarks regressed by more than "
+              f"{args.threshold:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(parser.parse_args(sys.argv[1:])))
@@ -0,0 +1,321 @@
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import random
+import string
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from bench.fakes import FakeBot, FakeMember, FakeMessage, FakeRole, Latency
+from cogs.autoroles import AutoRoles
+from cogs.prefix import KEY_NAME, PrefixManager
+from cogs.selfroles import SelfRoles
+from fresnel.core.cache import CacheManager
+from fresnel.core.monitor import percentile
+from fresnel.core.recorder import FORMAT_VERSION, SCORED_CHARS
+
+
+log = logging.getLogger(__name__)
+
+SCORED_POOL = sorted(SCORED_CHARS)
+FILLER_POOL = string.digits + ' '
+
+
+def synthesize_content(length: int, scored: int, digest: str):
+    """Build stand-in message content from its recorded features.
+
+    The result has the recorded length and number of distinct scored
+    characters, and equal digests always give equal content.
+    """
+
+    rng = random.Random(digest)
+    chars = rng.sample(SCORED_POOL, min(scored, length))
+    filler = rng.sample(FILLER_POOL, rng.randint(1, len(FILLER_POOL)))
+    chars.extend(
+        filler[index % len(filler)]
+        for index
+        in range(length - len(chars))
+    )
+    rng.shuffle(chars)
+    return ''.join(chars)
+
+
+def read_recording(path: Path):
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        header = json.loads(next(f))
+        if header.get('version') != FORMAT_VERSION:
+            raise ValueError(
+                f"{path} is format version {header.get('version')}, "
+                f"expected {FORMAT_VERSION}"
+            )
+        events = [json.loads(line) for line in f]
+    return header, events
+
+
+def build_bot(header: dict, latency: Latency):
+    bot = FakeBot(header['user_id'], latency)
+    db = bot._db_pool
+    prefixes = {}
+
+    for entry in header['guilds']:
+        guild = bot.add_guild(entry['id'])
+        for role_id, name, position in entry['roles']:
+            if role_id != guild.id:
+                guild.add_role(role_id, name, position)
+        for member_id, is_bot, role_ids in entry['members']:
+            guild.add_member(member_id, is_bot, role_ids)
+
+        db.seed(
+            f'autoroles-{guild.id}', ('role_id', 'thz'),
+            entry.get('autoroles', ()),
+        )
+        db.seed(f'thz-{guild.id}', ('user_id', 'thz'), entry.get('thz', ()))
+        db.seed(
+            f'selfroles-{guild.id}', ('role_id',),
+            ((role_id,) for role_id in entry.get('selfroles', ())),
+        )
+        if entry.get('prefixes'):
+            prefixes[guild.id] = entry['prefixes']
+
+    bot.redis_pool.seed_prefixes(KEY_NAME, prefixes)
+    return bot
+
+
+class Replay:
+    def __init__(self, bot: FakeBot, speed: float):
+        self.bot = bot
+        self.speed = speed
+        self.timings = defaultdict(list)
+        self.pending = set()
+        self.unhandled = 0
+        self.ticks = 0
+
+    async def start(self):
+        bot = self.bot
+        self.cache = CacheManager(bot)
+        self.prefix = PrefixManager(bot)
+        self.selfroles = SelfRoles(bot)
+        self.autoroles = AutoRoles(bot)
+
+        for name, cog in (
+                ('CacheManager._init', self.cache),
+                ('PrefixManager._init', self.prefix),
+                ('SelfRoles._init', self.selfroles),
+                ('AutoRoles._init', self.autoroles),
+        ):
+            start = time.perf_counter()
+            await cog._init()
+            self.timings[name].append(time.perf_counter() - start)
+
+        # THz passes run on the replay clock instead
+        self.autoroles.ptask.cancel()
+
+    def spawn(self, name: str, coro):
+        task = self.bot.loop.create_task(self.timed(name, coro))
+        self.pending.add(task)
+        task.add_done_callback(self.pending.discard)
+
+    async def timed(self, name: str, coro):
+        start = time.perf_counter()
+        try:
+            await coro
+        except Exception:
+            log.exception(f"{name} failed during replay")
+        finally:
+            self.timings[name].append(time.perf_counter() - start)
+
+    def feed(self, event: str, data: dict):
+        guild = self.bot.get_guild(data['g'])
+        if guild is None:
+            return
+        handler = getattr(self, f'on_{event.lower()}', None)
+        if handler is None:
+            self.unhandled += 1
+        else:
+            handler(guild, data)
+
+    def on_message_create(self, guild, data):
+        author = guild.get_member(data['u'])
+        if author is None:
+            # webhooks and members that left before the recording ended
+            author = FakeMember(
+                guild, data['u'], data['b'], [guild.default_role],
+            )
+
+        message = FakeMessage(
+            data['m'], guild, data['c'], author,
+            synthesize_content(data['l'], data['k'], data['h']),
+        )
+
+        start = time.perf_counter()
+        self.bot.command_prefix(self.bot, message)
+        self.timings['PrefixManager.get_prefix'].append(
+            time.perf_counter() - start
+        )
+
+        self.spawn('AutoRoles.on_message', self.autoroles.on_message(message))
+
+    def on_guild_member_add(self, guild, data):
+        member = guild.add_member(data['u'], data['b'], data['r'])
+        self.spawn('CacheManager.on_member_join',
+                   self.cache.on_member_join(member))
+        self.spawn('AutoRoles.on_member_join',
+                   self.autoroles.on_member_join(member))
+
+    def on_guild_member_update(self, guild, data):
+        member = guild.get_member(data['u'])
+        if member is None:
+            return
+        before = member.copy()
+        member.roles = [guild.default_role] + [
+            role
+            for role
+            in map(guild.get_role, data['r'])
+            if role
+        ]
+        self.spawn('CacheManager.on_member_update',
+                   self.cache.on_member_update(before, member))
+
+    def on_guild_member_remove(self, guild, data):
+        member = guild.remove_member(data['u'])
+        if member is None:
+            return
+        self.spawn('CacheManager.on_member_remove',
+                   self.cache.on_member_remove(member))
+        self.spawn('AutoRoles.on_member_remove',
+                   self.autoroles.on_member_remove(member))
+
+    def on_guild_role_create(self, guild, data):
+        role = guild.add_role(data['id'], data['n'], data['p'])
+        self.spawn('CacheManager.on_guild_role_create',
+                   self.cache.on_guild_role_create(role))
+
+    def on_guild_role_update(self, guild, data):
+        role = guild.get_role(data['id'])
+        if role is None:
+            return
+        before = FakeRole(guild, role.id, role.name, role.position)
+        role.name, role.position = data['n'], data['p']
+        self.spawn('CacheManager.on_guild_role_update',
+                   self.cache.on_guild_role_update(before, role))
+        self.spawn('SelfRoles.on_guild_role_update',
+                   self.selfroles.on_guild_role_update(before, role))
+
+    def on_guild_role_delete(self, guild, data):
+        role = guild.remove_role(data['id'])
+        if role is None:
+            return
+        self.spawn('CacheManager.on_guild_role_delete',
+                   self.cache.on_guild_role_delete(role))
+        self.spawn('SelfRoles.on_guild_role_delete',
+                   self.selfroles.on_guild_role_delete(role))
+        self.spawn('AutoRoles.on_guild_role_delete',
+                   self.autoroles.on_guild_role_delete(role))
+
+    def tick(self, until: float):
+        while (self.ticks + 1) * AutoRoles.THZ_INTERVAL <= until:
+            self.ticks += 1
+            self.spawn('AutoRoles._periodic', self.autoroles._periodic())
+
+    async def run(self, events):
+        origin = time.perf_counter()
+        for offset, event, data in events:
+            if self.speed:
+                delay = offset / self.speed - (time.perf_counter() - origin)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            self.tick(offset)
+            self.feed(event, data)
+            await asyncio.sleep(0)
+
+        # batched work such as queued joins runs from scheduler timers
+        scheduler = self.bot.scheduler
+        while self.pending or scheduler.pending:
+            await asyncio.wait(tuple(self.pending | scheduler.pending))
+        return time.perf_counter() - origin
+
+    def report(self, events: int, elapsed: float):
+        bot = self.bot
+        lines = [
+            f"replayed {events} events in {elapsed:.2f}s "
+            f"({events / max(elapsed, 1e-9):,.0f} events/s), "
+            f"{self.unhandled} without a consumer, "
+            f"{self.ticks} THz passes",
+            '',
+            f"{'handler':<36} {'calls':>7} {'p50':>9} {'p90':>9} "
+            f"{'p99':>9} {'max':>9}",
+        ]
+        for name, samples in sorted(self.timings.items()):
+            ordered = sorted(samples)
+            lines.append(
+                f"{name:<36} {len(ordered):>7} " + ' '.join(
+                    f"{value * 1000:>7.2f}ms"
+                    for value
+                    in (
+                        percentile(ordered, 0.50),
+                        percentile(ordered, 0.90),
+                        percentile(ordered, 0.99),
+                        ordered[-1],
+                    )
+                )
+            )
+
+        lines.append('')
+        for title, counts in (
+                ("REST calls", bot.rest.calls),
+                ("SQL statements", bot._db_pool.statements),
+                ("Redis commands", bot.redis_pool.commands),
+        ):
+            lines.append(f"{title}: " + (', '.join(
+                f"{name} {count}"
+                for name, count
+                in counts.most_common()
+            ) or 'none'))
+        return '\n'.join(lines)
+
+
+parser = argparse.ArgumentParser(
+    prog='bench.replay',
+    description="replay a gateway recording against fake backends",
+)
+parser.add_argument('recording', type=Path)
+parser.add_argument(
+    '--speed', type=float, default=1.0,
+    help="playback speed multiplier, 0 to replay as fast as possible",
+)
+parser.add_argument(
+    '--db-latency', type=float, default=1.0, metavar='MS',
+    help="simulated PostgreSQL round trip",
+)
+parser.add_argument(
+    '--redis-latency', type=float, default=0.5, metavar='MS',
+    help="simulated Redis round trip",
+)
+parser.add_argument(
+    '--rest-latency', type=float, default=50.0, metavar='MS',
+    help="simulated Discord REST round trip",
+)
+
+
+def main(args):
+    logging.basicConfig(level=logging.WARNING)
+    header, events = read_recording(args.recording)
+    latency = Latency(
+        db=args.db_latency / 1000,
+        redis=args.redis_latency / 1000,
+        rest=args.rest_latency / 1000,
+    )
+
+    loop = asyncio.get_event_loop()
+    replay = Replay(build_bot(header, latency), args.speed)
+    loop.run_until_complete(replay.start())
+    elapsed = loop.run_until_complete(replay.run(events))
+    print(replay.report(len(events), elapsed))
+
+
+if __name__ == '__main__':
+    main(parser.parse_args(sys.argv[1:]))
@@ -1,8 +1,11 @@
 import asyncio
 import logging
 import string
+import time
 from bisect import bisect_right, insort_right
-from functools import reduce
+from collections import OrderedDict
+from functools import partial, reduce
+from itertools import islice
 from operator import or_
 
 from discord import Embed, Guild, Member, Message, Role
@@ -24,6 +27,11 @@ from fresnel.core.util import EmbedPaginator
 
 log = logging.getLogger(__name__)
 
+REQUIRES = ('ready', 'db', 'role_cache', 'warm_state')
+PROVIDES = ()
+STATE_VERSION = 2
+SNAPSHOT = True
+
 ROLE_SCHEMA = """
 CREATE TABLE IF NOT EXISTS "{name}" (
     role_id BIGINT NOT NULL,
@@ -40,10 +48,97 @@ CREATE TABLE IF NOT EXISTS "{name}" (
 )
 """
 
+# serves leaderboard pages and ranks in rank_users order
+THZ_INDEX = """
+CREATE INDEX IF NOT EXISTS "{name}-rank" ON "{name}" (thz DESC, user_id DESC)
+"""
+
+# only walks the index entries ranked above the user
+RANK_QUERY = """
+SELECT count(*) + 1
+FROM "{name}"
+WHERE (thz, user_id) > (%s, %s)
+"""
+
 CHARS = frozenset(string.ascii_letters + string.punctuation)
+INSERT_CHUNK = 1000
+PLAN_CHUNK = 1000
+ROLE_EDIT_BATCH = 10
+LEADERBOARD_LINES = 20
+
+
+# compute jobs: module level so they can run in worker processes
+
+def rank_users(thz_items):
+    return sorted(
+        (
+            (thz, user_id)
+            for user_id, thz
+            in thz_items
+        ),
+        reverse=True,
+    )
+
+
+def plan_autoroles(levels, thz: dict, holders: dict, user_ids=None):
+    """Work out the autorole every user should hold.
+
+    ``levels`` is a sorted tuple of (thz, role_id) registrations and
+    ``holders`` maps each registered role id to the users holding it.
+    Returns the desired role of each user and the (user_id, role_id to
+    add or None, role ids to remove) changes needed to get there.
+    """
+
+    values = [value for value, _ in levels]
+    held = {}
+    for role_id, members in holders.items():
+        for user_id in members:
+            held.setdefault(user_id, []).append(role_id)
+
+    if user_ids is None:
+        user_ids = thz.keys() | held.keys()
+
+    desired = {}
+    changes = []
+    for user_id in user_ids:
+        index = bisect_right(values, thz.get(user_id, 0)) - 1
+        role_id = levels[index][1] if index >= 0 else None
+        desired[user_id] = role_id
+
+        current = held.get(user_id, ())
+        add = None
+        if role_id is not None and role_id not in current:
+            add = role_id
+        remove = tuple(r for r in current if r != role_id)
+        if add is not None or remove:
+            changes.append((user_id, add, remove))
+
+    return desired, changes
+
+
+def rank_position(ranked, user_id: int, thz: int):
+    """Rank of ``thz`` in a rank_users ranking, by binary search."""
+
+    key = (thz, user_id)
+    low, high = 0, len(ranked)
+    while low < high:
+        middle = (low + high) // 2
+        if ranked[middle] > key:
+            low = middle + 1
+        else:
+            high = middle
+    return low + 1
+
 
-backup_flag = asyncio.Event()
-backup_flag.set()
+def render_leaderboard(guild: Guild, start: int, rows):
+    # membership is only looked up for the users a page shows
+    lines = []
+    for position, (user_id, thz) in enumerate(rows, start=start):
+        if guild.get_member(user_id):
+            lines.append(f"{position}. <@{user_id}> - {thz:,} THz")
+        else:
+            lines.append(f"{position}. user {user_id} - {thz:,} THz")
+    return '\n'.join(lines) or "No more users."
 
 
 class AutoRoleCache:
@@ -111,6 +206,171 @@ class AutoRoleCache:
             raise ValueError("no such role id")
 
 
+class ThzCache:
+    """The hot tier of a guild's THz values, evicting least recently used.
+
+    The THz table is always written through, so evicted users are only
+    cold, not lost. ``complete`` stays true while every tracked user
+    is held, letting reads skip the database entirely.
+    """
+
+    def __init__(self, max_users: int = 0, on_evict=None):
+        self.users = OrderedDict()
+        self.max_users = max_users
+        self.on_evict = on_evict
+        self.complete = True
+
+    def __len__(self):
+        return len(self.users)
+
+    def __contains__(self, user_id: int):
+        return user_id in self.users
+
+    def items(self):
+        return self.users.items()
+
+    def peek(self, user_id: int, default=None):
+        return self.users.get(user_id, default)
+
+    def get(self, user_id: int, default=None):
+        if user_id in self.users:
+            self.users.move_to_end(user_id)
+            return self.users[user_id]
+        return default
+
+    def set(self, user_id: int, thz: int):
+        self.users[user_id] = thz
+        self.users.move_to_end(user_id)
+        self.trim()
+
+    def load(self, items):
+        """Fill the cache up to its limit without evicting anything."""
+
+        for user_id, thz in items:
+            if self.max_users and len(self.users) >= self.max_users:
+                self.complete = False
+                return
+            self.users[user_id] = thz
+
+    def pop(self, user_id: int, default=None):
+        return self.users.pop(user_id, default)
+
+    def trim(self):
+        while self.max_users and len(self.users) > self.max_users:
+            user_id, _ = self.users.popitem(last=False)
+            self.complete = False
+            if self.on_evict:
+                self.on_evict(user_id)
+
+
+class LeaderboardPages:
+    """Leaderboard pages read from the database as they are shown.
+
+    Pages are found by keyset from a neighbouring page, or from either
+    end of the ranking, so each costs the same however large the guild.
+    """
+
+    def __init__(self, pool, guild: Guild, total: int, ttl: float):
+        self.pool = pool
+        self.guild = guild
+        self.name = f'thz-{guild.id}'
+        self.total = total
+        self.expires = time.monotonic() + ttl
+        # index: (text, first (thz, user_id), last (thz, user_id))
+        self.pages = {}
+
+    def __len__(self):
+        return max(1, -(-self.total // LEADERBOARD_LINES))
+
+    @property
+    def expired(self):
+        return time.monotonic() >= self.expires
+
+    async def _query(self, sql: str, params):
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(sql, params)
+                return await cur.fetchall()
+
+    def add_page(self, index: int, rows):
+        first = last = None
+        if rows:
+            first = rows[0][1], rows[0][0]
+            last = rows[-1][1], rows[-1][0]
+        self.pages[index] = (
+            render_leaderboard(
+                self.guild, index * LEADERBOARD_LINES + 1, rows,
+            ),
+            first,
+            last,
+        )
+
+    async def _load_after(self, index: int):
+        _, _, key = self.pages[index - 1]
+        if key is None:
+            # users left since the total was counted
+            self.add_page(index, ())
+            return
+        rows = await self._query(
+            f'SELECT user_id, thz FROM "{self.name}" '
+            f'WHERE (thz, user_id) < (%s, %s) '
+            f'ORDER BY thz DESC, user_id DESC LIMIT %s',
+            key + (LEADERBOARD_LINES,),
+        )
+        self.add_page(index, rows)
+
+    async def _load_before(self, index: int):
+        _, key, _ = self.pages.get(index + 1, (None, None, None))
+        if key is not None:
+            where = 'WHERE (thz, user_id) > (%s, %s) '
+            params = key + (LEADERBOARD_LINES,)
+        else:
+            # the last page, read up from the bottom of the ranking
+            where = ''
+            params = (max(0, self.total - index * LEADERBOARD_LINES),)
+        rows = await self._query(
+            f'SELECT user_id, thz FROM "{self.name}" {where}'
+            f'ORDER BY thz, user_id LIMIT %s',
+            params,
+        )
+        self.add_page(index, rows[::-1])
+
+    async def fetch(self, index: int):
+        if index not in self.pages:
+            below = max((i for i in self.pages if i < index), default=None)
+            above = min(
+                (i for i in self.pages if i > index), default=len(self),
+            )
+            # walk from the nearest loaded page when navigation skipped
+            # over some
+            if below is not None and index - below <= above - index:
+                for i in range(below + 1, index + 1):
+                    await self._load_after(i)
+            else:
+                for i in range(above - 1, index - 1, -1):
+                    await self._load_before(i)
+        return self.pages[index][0]
+
+
+class RankedPages:
+    """Leaderboard pages rendered from a rank_users ranking as shown."""
+
+    def __init__(self, guild: Guild, ranked):
+        self.guild = guild
+        self.ranked = ranked
+
+    def __len__(self):
+        return max(1, -(-len(self.ranked) // LEADERBOARD_LINES))
+
+    async def fetch(self, index: int):
+        start = index * LEADERBOARD_LINES
+        return render_leaderboard(self.guild, start + 1, (
+            (user_id, thz)
+            for thz, user_id
+            in self.ranked[start:start + LEADERBOARD_LINES]
+        ))
+
+
 class AutoRoles(Cog):
     THZ_INTERVAL = 120
 
@@ -123,100 +383,307 @@ class AutoRoles(Cog):
         self.thz_cache = {}
         self.user_cache = {}
         self.time_cache = {}
+        self.leaderboards = {}
+        # guild_id: (tracked users, monotonic expiry)
+        self.thz_totals = {}
+        # guild_id: (hot tier in rank_users order, monotonic expiry)
+        self.rankings = {}
+        # guild_id: (timer, {member_id: member}) of joins awaiting a flush
+        self.joins = {}
+        self.flushing = 0
         self.ptask = None
+        self.load_config()
+
+        self.messages_metric = bot.metrics.counter(
+            'fresnel_autoroles_messages_total',
+            "Guild messages seen by autoroles.",
+        )
+        self.periodic_metric = bot.metrics.histogram(
+            'fresnel_autoroles_periodic_seconds',
+            "Duration of each THz allocation pass.",
+        )
+        self.join_batch_metric = bot.metrics.histogram(
+            'fresnel_autoroles_join_batch_size',
+            "Members added by each flush of queued joins.",
+            buckets=(1, 2, 5, 10, 25, 50, 100, 250, 1000),
+        )
+
+    def load_config(self):
+        self.hot_users = self.bot._config.get(
+            'thz_hot_users', 100000,
+            "THz values per guild kept in memory, 0 to keep every user",
+        )
+        self.sql_leaderboard = self.bot._config.get(
+            'thz_leaderboard_sql', False,
+            "always read leaderboards and ranks from the database",
+        )
+        self.leaderboard_ttl = self.bot._config.get(
+            'thz_leaderboard_ttl', 30.0,
+            "seconds leaderboard pages and rankings are reused for",
+        )
+        self.join_window = self.bot._config.get(
+            'autorole_join_window', 1.0,
+            "seconds member joins are collected before being added at once",
+        )
+
+    async def on_config_update(self, changed):
+        self.load_config()
+        for cache in self.thz_cache.values():
+            cache.max_users = self.hot_users
+            cache.trim()
+
+    def _new_thz_cache(self, guild_id: int):
+        self.thz_cache[guild_id] = cache = ThzCache(
+            self.hot_users, partial(self._evicted, guild_id),
+        )
+        return cache
+
+    def _evicted(self, guild_id: int, user_id: int):
+        self.user_cache[guild_id].pop(user_id, None)
 
     async def _init(self):
-        for guild in self.bot.guilds:
-            role_name = f'autoroles-{guild.id}'
-            thz_name = f'thz-{guild.id}'
+        with self.bot.rest_scheduler.background():
+            for guild in self.bot.guilds:
+                with self.bot.startup_trace.span(__name__, 'init', guild.id):
+                    await self._init_guild(guild)
 
-            self.tables[guild.id] = {}
-            self.tables[guild.id]['role'] = role_table = Table(role_name)
-            self.tables[guild.id]['thz'] = thz_table = Table(thz_name)
+        self.ptask = self.bot.loop.create_task(
+            self.periodic()
+        )
 
-            self.role_cache[guild.id] = AutoRoleCache()
-            self.thz_cache[guild.id] = {}
-            self.user_cache[guild.id] = {}
+    async def _init_guild(self, guild: Guild):
+        role_name = f'autoroles-{guild.id}'
+        thz_name = f'thz-{guild.id}'
 
-            self.time_cache[guild.id] = {}
+        self.tables[guild.id] = {}
+        self.tables[guild.id]['role'] = role_table = Table(role_name)
+        self.tables[guild.id]['thz'] = Table(thz_name)
 
-            async with self.pool.acquire() as conn:
-                async with conn.cursor() as cur:
-                    await cur.execute(
-                        ROLE_SCHEMA.format(name=role_name)
+        self.role_cache[guild.id] = AutoRoleCache()
+        self._new_thz_cache(guild.id)
+        self.user_cache[guild.id] = {}
+
+        self.time_cache[guild.id] = {}
+
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(
+                    ROLE_SCHEMA.format(name=role_name)
+                )
+
+                await cur.execute(str(
+                    self.Query.from_(role_table).select(
+                        role_table.role_id, role_table.thz,
                     )
+                ))
 
-                    await cur.execute(str(
-                        self.Query.from_(role_table).select(
-                            role_table.role_id, role_table.thz,
-                        )
-                    ))
+                cleanup = []
+                async for role_id, thz in cur:
+                    role = guild.get_role(role_id)
+
+                    if role:
+                        self.role_cache[guild.id].add_role(role.id, thz)
+                    else:
+                        cleanup.append(role_id)
 
-                    cleanup = []
-                    async for role_id, thz in cur:
-                        role = guild.get_role(role_id)
+                if cleanup:
+                    await self._remove_roles(guild.id, *cleanup)
 
-                        if role:
-                            self.role_cache[guild.id].add_role(role.id, thz)
-                        else:
-                            cleanup.append(role_id)
+            async with conn.cursor() as cur:
+                await cur.execute(
+                    THZ_SCHEMA.format(name=thz_name)
+                )
+                await cur.execute(
+                    THZ_INDEX.format(name=thz_name)
+                )
 
-                    if cleanup:
-                        await self._remove_roles(guild.id, *cleanup)
+                # cheaper than holding every tracked id to find the
+                # members missing from the table
+                await self._insert_users(cur, guild.id, (
+                    member.id for member in guild.members if not member.bot
+                ))
 
+        # compare desired and held autoroles offline, then only send
+        # the differences
+        await self._sweep(guild)
+
+    async def _insert_users(self, cur, guild_id: int, user_ids):
+        """Track ``user_ids`` from 0 THz, leaving existing rows alone."""
+
+        table = self.tables[guild_id]['thz']
+        user_ids = iter(user_ids)
+        while True:
+            chunk = tuple(islice(user_ids, INSERT_CHUNK))
+            if not chunk:
+                return
+            # rows written by a THz pass in the meantime win
+            await cur.execute(str(
+                self.Query.into(table).insert(*(
+                    (user_id, 0)
+                    for user_id
+                    in chunk
+                ))
+            ) + ' ON CONFLICT DO NOTHING')
+
+    async def _sweep(self, guild: Guild, low: int = None, high: int = None):
+        """Apply autoroles to tracked users a chunk at a time.
+
+        The THz table is walked in user id order, optionally only over
+        ``low <= thz < high``, so planning memory stays flat however
+        large the guild is. Users who left are removed on the way and
+        the rest fill the hot tier while it has room.
+        """
+
+        table = self.tables[guild.id]['thz']
+        cache = self.thz_cache[guild.id]
+        after = 0
+        while True:
+            query = self.Query.from_(table).select(table.user_id, table.thz)
+            if low is not None:
+                query = query.where(table.thz >= low)
+            if high is not None:
+                query = query.where(table.thz < high)
+            query = query.where(
+                table.user_id > after
+            ).orderby(table.user_id).limit(PLAN_CHUNK)
+
+            async with self.pool.acquire() as conn:
                 async with conn.cursor() as cur:
-                    await cur.execute(
-                        THZ_SCHEMA.format(name=thz_name)
-                    )
+                    await cur.execute(str(query))
+                    rows = [row async for row in cur]
+            if not rows:
+                return
+            after = rows[-1][0]
+
+            thz = {}
+            departed = []
+            for user_id, value in rows:
+                if guild.get_member(user_id):
+                    thz[user_id] = cache.peek(user_id, value)
+                else:
+                    departed.append(user_id)
+            if departed:
+                await self._remove_users(guild.id, *departed)
+
+            cache.load(
+                (user_id, value)
+                for user_id, value
+                in thz.items()
+                if user_id not in cache
+            )
+            if thz:
+                await self._apply_autoroles(guild, thz)
+
+    async def _sweep_level(self, guild: Guild, thz: int, role=None):
+        """Apply autoroles to whoever a level at ``thz`` can affect.
+
+        Only users between it and the next level up change their
+        desired role, besides the holders of the level's ``role``.
+        """
+
+        values = self.role_cache[guild.id].values
+        index = bisect_right(values, thz)
+        high = values[index] if index < len(values) else None
+
+        if role is not None:
+            holders = tuple(self.bot.get_role_member_ids(role) or ())
+            for start in range(0, len(holders), PLAN_CHUNK):
+                chunk = holders[start:start + PLAN_CHUNK]
+                current = await self._fetch_thz(guild.id, chunk)
+                # the sweep below plans everyone inside the level
+                outside = {}
+                for user_id in chunk:
+                    value = current.get(user_id, 0)
+                    if value < thz or high is not None and value >= high:
+                        outside[user_id] = value
+                if outside:
+                    await self._apply_autoroles(guild, outside)
+
+        await self._sweep(guild, thz, high)
+
+    async def _reconcile_guild(self, guild: Guild):
+        # adopted state matches the database, but the guild may have
+        # changed while it was saved
+        roles = [
+            role_id
+            for role_id, _
+            in self.role_cache[guild.id].items()
+            if not guild.get_role(role_id)
+        ]
+        if roles:
+            await self._remove_roles(guild.id, *roles)
 
-                    await cur.execute(str(
-                        self.Query.from_(thz_table).select(
-                            thz_table.user_id, thz_table.thz,
-                        )
-                    ))
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await self._insert_users(cur, guild.id, (
+                    member.id for member in guild.members if not member.bot
+                ))
 
-                    cleanup = []
-                    member_ids = set((
-                        member.id
-                        for member
-                        in guild.members
-                        if not member.bot
-                    ))
-                    async for user_id, thz in cur:
-                        member_ids.discard(user_id)
+        await self._sweep(guild)
+
+    def export_state(self):
+        return {
+            'roles': {
+                guild_id: dict(roles.items())
+                for guild_id, roles
+                in self.role_cache.items()
+            },
+            'thz': {
+                guild_id: (tuple(cache.items()), cache.complete)
+                for guild_id, cache
+                in self.thz_cache.items()
+            },
+            'users': self.user_cache,
+            'time': self.time_cache,
+        }
+
+    async def adopt_state(self, state):
+        for guild in self.bot.guilds:
+            if guild.id not in state['thz']:
+                with self.bot.startup_trace.span(__name__, 'init', guild.id):
+                    await self._init_guild(guild)
+                continue
 
-                        user = guild.get_member(user_id)
+            self.tables[guild.id] = {
+                'role': Table(f'autoroles-{guild.id}'),
+                'thz': Table(f'thz-{guild.id}'),
+            }
 
-                        if user:
-                            self.thz_cache[guild.id][user.id] = thz
-                            await self._update_user_role(cur, guild, user)
-                        else:
-                            cleanup.append(user_id)
+            self.role_cache[guild.id] = roles = AutoRoleCache()
+            for role_id, thz in state['roles'].get(guild.id, {}).items():
+                roles.add_role(role_id, thz)
 
-                    if cleanup:
-                        await self._remove_users(guild.id, *cleanup)
+            self.user_cache[guild.id] = state['users'].get(guild.id, {})
+            self.time_cache[guild.id] = state['time'].get(guild.id, {})
 
-                    for member_id in member_ids:
-                        await self.on_member_join(guild.get_member(member_id))
+            items, complete = state['thz'][guild.id]
+            cache = self._new_thz_cache(guild.id)
+            cache.load(items)
+            cache.complete = cache.complete and complete
 
-        await self.bot.fresnel_cache_flag.wait()
+            with self.bot.startup_trace.span(__name__, 'reconcile', guild.id):
+                await self._reconcile_guild(guild)
 
         self.ptask = self.bot.loop.create_task(
             self.periodic()
         )
 
-    def __unload(self):
+    def cog_unload(self):
         if self.ptask:
             self.ptask.cancel()
+        # members still queued are picked up by the next reconcile
+        for timer, _ in self.joins.values():
+            self.bot.scheduler.cancel(timer)
+        self.joins.clear()
 
     async def periodic(self):
         while True:
-            if not backup_flag.is_set():
-                break
             await asyncio.sleep(self.THZ_INTERVAL)
             try:
                 log.debug("allocating THz")
-                await self._periodic()
+                with self.periodic_metric.time(), \
+                        self.bot.rest_scheduler.background():
+                    await self._periodic()
             except asyncio.CancelledError:
                 return
             except Exception as e:
@@ -226,30 +693,59 @@ class AutoRoles(Cog):
         time_cache = self.time_cache
         self.time_cache = {guild.id: {} for guild in self.bot.guilds}
 
+        totals = {}
         for guild_id, users in time_cache.items():
+            # active users are promoted to the hot tier
+            current = await self._fetch_thz(guild_id, users)
+            totals[guild_id] = guild_totals = {}
             for user_id, delta in users.items():
-                if delta is None:
-                    inc = 1
-                    continue
-
-                inc = 1 + delta.get('len', 0) + delta.get('var', 0)
-                self.thz_cache[guild_id][user_id] = (
-                    inc + self.thz_cache[guild_id].get(user_id, 0)
-                )
+                thz = current.get(user_id, 0)
+                if delta is not None:
+                    thz += 1 + delta.get('len', 0) + delta.get('var', 0)
+                guild_totals[user_id] = thz
+                self.thz_cache[guild_id].set(user_id, thz)
 
         async with self.pool.acquire() as conn:
-            for guild_id, users in time_cache.items():
+            for guild_id, users in totals.items():
                 guild = self.bot.get_guild(guild_id)
                 async with conn.cursor() as cur:
-                    for user_id, delta in users.items():
+                    for user_id, thz in users.items():
                         await self._update_user_thz(
-                            cur, guild_id, user_id
+                            cur, guild_id, user_id, thz
                         )
                         await self._update_user_role(
-                            cur, guild, guild.get_member(user_id)
+                            cur, guild, guild.get_member(user_id), thz
                         )
 
-    async def _update_user_thz(self, cursor, guild_id, user_id):
+    async def _fetch_thz(self, guild_id: int, user_ids):
+        """THz values of the tracked users among ``user_ids``, by user.
+
+        Hot values are used where present; cold users are read from the
+        database without being promoted.
+        """
+
+        cache = self.thz_cache[guild_id]
+        cold = [user_id for user_id in user_ids if user_id not in cache]
+
+        thz = {}
+        if cold and not cache.complete:
+            table = self.tables[guild_id]['thz']
+            async with self.pool.acquire() as conn:
+                async with conn.cursor() as cur:
+                    await cur.execute(str(
+                        self.Query.from_(table).select(
+                            table.user_id, table.thz,
+                        ).where(table.user_id.isin(cold))
+                    ))
+                    async for user_id, value in cur:
+                        thz[user_id] = value
+
+        for user_id in user_ids:
+            if user_id in cache:
+                thz[user_id] = cache.peek(user_id)
+        return thz
+
+    async def _update_user_thz(self, cursor, guild_id, user_id, thz):
         table = self.tables[guild_id]['thz']
         try:
             await cursor.execute(str(
@@ -257,23 +753,21 @@ class AutoRoles(Cog):
                     table
                 ).insert(
                     user_id,
-                    self.thz_cache[guild_id][user_id],
+                    thz,
                 )
             ))
         except IntegrityError:
             await cursor.execute(str(
                 self.Query.update(table).set(
                     table.thz,
-                    self.thz_cache[guild_id][user_id],
+                    thz,
                 ).where(
                     table.user_id == user_id
                 )
             ))
 
-    async def _update_user_role(self, cursor, guild, member):
-        role_id = self.role_cache[guild.id].get_nearest_role_id(
-            self.thz_cache[guild.id].get(member.id, 0)
-        )
+    async def _update_user_role(self, cursor, guild, member, thz):
+        role_id = self.role_cache[guild.id].get_nearest_role_id(thz)
 
         if self.user_cache[guild.id].get(member.id) == role_id:
             return
@@ -336,19 +830,183 @@ class AutoRoles(Cog):
                 pass
 
     def _get_user_ranks(self, guild_id: int):
-        return sorted(
-            (
-                (thz, user_id)
-                for user_id, thz
-                in self.thz_cache[guild_id].items()
-            ),
-            reverse=True,
+        return rank_users(self.thz_cache[guild_id].items())
+
+    async def _ranking(self, guild_id: int):
+        """The hot tier in rank_users order, sorted at most once per TTL."""
+
+        ranked, expires = self.rankings.get(guild_id, ((), 0.0))
+        if time.monotonic() < expires:
+            return ranked
+
+        # the one copy of the tier that every rank and leaderboard
+        # shares until it expires
+        thz_items = tuple(self.thz_cache[guild_id].items())
+        ranked = await self.bot.compute.run(
+            rank_users, thz_items, size=len(thz_items),
+        )
+        self.rankings[guild_id] = (
+            ranked, time.monotonic() + self.leaderboard_ttl,
+        )
+        return ranked
+
+    def _use_sql(self, guild_id: int):
+        return self.sql_leaderboard or not self.thz_cache[guild_id].complete
+
+    async def _sql_rank(self, guild_id: int, user_id: int, thz: int):
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(
+                    RANK_QUERY.format(name=f'thz-{guild_id}'),
+                    (thz, user_id),
+                )
+                rank, = await cur.fetchone()
+        # the cached total may predate the user
+        return rank, max(rank, await self._sql_total(guild_id))
+
+    async def _sql_total(self, guild_id: int):
+        """Tracked users of a guild, counted at most once per TTL."""
+
+        total, expires = self.thz_totals.get(guild_id, (0, 0.0))
+        if time.monotonic() < expires:
+            return total
+
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(f'SELECT count(*) FROM "thz-{guild_id}"')
+                total, = await cur.fetchone()
+        self.thz_totals[guild_id] = (
+            total, time.monotonic() + self.leaderboard_ttl,
+        )
+        return total
+
+    async def _sql_leaderboard(self, guild: Guild):
+        pages = self.leaderboards.get(guild.id)
+        if pages is not None and not pages.expired:
+            return pages
+
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(
+                    f'SELECT user_id, thz '
+                    f'FROM "thz-{guild.id}" '
+                    f'ORDER BY thz DESC, user_id DESC LIMIT %s',
+                    (LEADERBOARD_LINES,),
+                )
+                rows = await cur.fetchall()
+
+        self.leaderboards[guild.id] = pages = LeaderboardPages(
+            self.pool, guild, await self._sql_total(guild.id),
+            self.leaderboard_ttl,
+        )
+        pages.add_page(0, rows)
+        return pages
+
+    async def _apply_autoroles(self, guild: Guild, thz: dict):
+        """Give the users in ``thz`` the autorole their THz earns."""
+
+        roles = self.role_cache[guild.id]
+        levels = tuple(sorted(
+            (value, role_id) for role_id, value in roles.items()
+        ))
+        # only the holders being planned, never every holder of a role
+        holders = {}
+        for _, role_id in levels:
+            role = guild.get_role(role_id)
+            if role:
+                members = self.bot.get_role_member_ids(role) or ()
+                holders[role_id] = frozenset(
+                    user_id for user_id in thz if user_id in members
+                )
+
+        desired, changes = await self.bot.compute.run(
+            plan_autoroles, levels, thz, holders, size=len(thz),
+        )
+
+        # role memos are only kept for the hot tier
+        cache = self.thz_cache[guild.id]
+        self.user_cache[guild.id].update(
+            (user_id, role_id)
+            for user_id, role_id
+            in desired.items()
+            if user_id in cache
+        )
+        with self.bot.rest_scheduler.background():
+            for start in range(0, len(changes), ROLE_EDIT_BATCH):
+                results = await asyncio.gather(
+                    *(
+                        self._apply_change(guild, *change)
+                        for change
+                        in changes[start:start + ROLE_EDIT_BATCH]
+                    ),
+                    return_exceptions=True,
+                )
+                for result in results:
+                    if isinstance(result, Exception):
+                        log.warning(f"autorole update in {guild.id} "
+                                    f"failed: {result}")
+
+    async def _apply_change(self, guild: Guild, user_id: int, add_id,
+                            remove_ids):
+        member = guild.get_member(user_id)
+        if member is None or member.bot:
+            return
+
+        # gather runs every change in its own task, which has to be
+        # marked as background itself
+        with self.bot.rest_scheduler.background():
+            # per-role endpoints, so concurrent role changes made by
+            # anyone else are never overwritten
+            held = {role.id: role for role in member.roles}
+            if add_id is not None and add_id not in held:
+                await member.add_roles(
+                    guild.get_role(add_id),
+                    reason="Fresnel autoroles",
+                )
+            remove = [
+                held[role_id]
+                for role_id
+                in remove_ids or ()
+                if role_id in held
+            ]
+            if remove:
+                await member.remove_roles(
+                    *remove,
+                    reason="Fresnel autoroles",
+                )
+
+    def collect_metrics(self):
+        entries = self.bot.metrics.gauge(
+            'fresnel_cache_entries',
+            "Entries held in in-memory caches.",
+            ('cache',),
+        )
+        entries.set(
+            sum(map(len, self.thz_cache.values())),
+            cache='autoroles_thz',
+        )
+        entries.set(
+            sum(map(len, self.user_cache.values())),
+            cache='autoroles_user',
+        )
+        entries.set(
+            sum(map(len, self.time_cache.values())),
+            cache='autoroles_time',
+        )
+        self.bot.metrics.gauge(
+            'fresnel_autoroles_join_backlog',
+            "Member joins queued or being added.",
+        ).set(
+            sum(len(members) for _, members in self.joins.values())
+            + self.flushing
         )
 
     async def on_message(self, message: Message):
         if message.author.bot:
             return
 
+        self.messages_metric.inc()
+
         delta = self.time_cache[message.guild.id].get(message.author.id, {})
 
         if delta is None:
@@ -380,7 +1038,7 @@ class AutoRoles(Cog):
         self.tables[guild.id]['thz'] = Table(thz_name)
 
         self.role_cache[guild.id] = AutoRoleCache()
-        self.thz_cache[guild.id] = {}
+        self._new_thz_cache(guild.id)
         self.user_cache[guild.id] = {}
 
         self.time_cache[guild.id] = {}
@@ -394,6 +1052,9 @@ class AutoRoles(Cog):
                 await cur.execute(
                     THZ_SCHEMA.format(name=thz_name)
                 )
+                await cur.execute(
+                    THZ_INDEX.format(name=thz_name)
+                )
 
     async def on_guild_remove(self, guild: Guild):
         role_name = f'autoroles-{guild.id}'
@@ -404,6 +1065,9 @@ class AutoRoles(Cog):
         del self.role_cache[guild.id]
         del self.thz_cache[guild.id]
         del self.user_cache[guild.id]
+        self.leaderboards.pop(guild.id, None)
+        self.thz_totals.pop(guild.id, None)
+        self.rankings.pop(guild.id, None)
 
         del self.time_cache[guild.id]
 
@@ -418,49 +1082,76 @@ class AutoRoles(Cog):
                 )
 
     async def on_guild_role_delete(self, role: Role):
-        if role.id in self.role_cache[role.guild.id]:
+        thz = self.role_cache[role.guild.id].role_cache.get(role.id)
+        if thz is not None:
             await self._remove_roles(role.guild.id, role.id)
-
-            async with self.pool.acquire() as conn:
-                async with conn.cursor() as cur:
-                    for member in role.guild.members:
-                        if member.bot:
-                            continue
-
-                        await self._update_user_role(
-                            cur,
-                            role.guild,
-                            member,
-                        )
+            # the role went with its holders, only its level is left
+            await self._sweep_level(role.guild, thz)
 
     async def on_member_remove(self, member: Member):
+        queued = self.joins.get(member.guild.id)
+        if queued:
+            queued[1].pop(member.id, None)
         await self._remove_users(member.guild.id, member.id)
 
     async def on_member_join(self, member: Member):
         if member.bot:
             return
 
-        self.thz_cache[member.guild.id][member.id] = 0
-        async with self.pool.acquire() as conn:
-            async with conn.cursor() as cur:
-                await self._update_user_thz(cur, member.guild.id, member.id)
-                await self._update_user_role(cur, member.guild, member)
+        # joins arrive in bursts during raids, so they are added in one
+        # statement per guild and window instead of one round trip each
+        queued = self.joins.get(member.guild.id)
+        if queued is None:
+            timer = self.bot.scheduler.call_later(
+                self.join_window, self._flush_joins, member.guild.id,
+            )
+            self.joins[member.guild.id] = queued = (timer, {})
+        queued[1][member.id] = member
+
+    async def _flush_joins(self, guild_id: int):
+        _, members = self.joins.pop(guild_id)
+        guild = self.bot.get_guild(guild_id)
+        if not members or guild is None or guild_id not in self.thz_cache:
+            return
+
+        self.flushing += len(members)
+        try:
+            self.join_batch_metric.observe(len(members))
+            user_ids = tuple(members)
+
+            async with self.pool.acquire() as conn:
+                async with conn.cursor() as cur:
+                    await self._insert_users(cur, guild_id, user_ids)
+
+            cache = self.thz_cache[guild_id]
+            thz = {
+                user_id: cache.peek(user_id, 0)
+                for user_id
+                in user_ids
+                if guild.get_member(user_id)
+            }
+            for user_id, value in thz.items():
+                cache.set(user_id, value)
+
+            await self._apply_autoroles(guild, thz)
+        except Exception:
+            log.exception(f"adding {len(members)} joins to {guild_id} failed")
+        finally:
+            self.flushing -= len(members)
 
     @command(aliases=('lb',))
     @cooldown(1, 10.0, BucketType.channel)
     async def leaderboard(self, ctx: Context):
         """Display THz counts for this server."""
 
-        ranks = self._get_user_ranks(ctx.guild.id)
-
-        pages = EmbedPaginator(ctx, f"THz counts for {ctx.guild.name}...")
-        for index, (thz, user_id) in enumerate(ranks, start=1):
-            member = ctx.guild.get_member(user_id)
-            if member:
-                pages.add_line(f"{index}. {member.mention} - {thz:,} THz")
-            else:
-                pages.add_line(f"{index}. user {user_id} - {thz:,} THz")
+        if self._use_sql(ctx.guild.id):
+            view = await self._sql_leaderboard(ctx.guild)
+        else:
+            view = RankedPages(ctx.guild, await self._ranking(ctx.guild.id))
 
+        pages = EmbedPaginator(
+            ctx, f"THz counts for {ctx.guild.name}...", pages=view,
+        )
         await pages.send_to()
 
     @command(aliases=('level', 'xp'))
@@ -471,28 +1162,39 @@ class AutoRoles(Cog):
         if not member:
             member = ctx.author
 
-        try:
-            thz = self.thz_cache[ctx.guild.id][member.id]
-        except KeyError:
+        cache = self.thz_cache[ctx.guild.id]
+        thz = cache.get(member.id)
+        if thz is None and not cache.complete:
+            thz = (await self._fetch_thz(ctx.guild.id, (member.id,))).get(
+                member.id,
+            )
+            if thz is not None:
+                cache.set(member.id, thz)
+        if thz is None:
             await ctx.send("Untracked user!")
             return
 
         role_id = self.user_cache[ctx.guild.id].get(member.id)
+        if role_id is None:
+            role_id = self.role_cache[ctx.guild.id].find_highest_role_id(
+                frozenset(role.id for role in member.roles)
+            )
         role = ctx.guild.get_role(role_id) if role_id else None
 
-        ranks = self._get_user_ranks(ctx.guild.id)
-
-        for index, (thz, user_id) in enumerate(ranks, start=1):
-            if user_id == member.id:
-                rank = index
-                break
+        if self._use_sql(ctx.guild.id):
+            rank, total = await self._sql_rank(ctx.guild.id, member.id, thz)
+        else:
+            rank = rank_position(
+                await self._ranking(ctx.guild.id), member.id, thz,
+            )
+            total = max(rank, len(cache))
 
         embed = Embed(
             title=f"{member.name}'s THz for {ctx.guild.name}",
             description=(
                 f"**Total**: {thz:,} THz\n"
                 f"**Role**: {role.mention if role else 'N/A'}\n"
-                f"**Rank**: #{rank}/{len(self.thz_cache[ctx.guild.id])}\n"
+                f"**Rank**: #{rank}/{total}\n"
             ),
         ).set_thumbnail(
             url=member.avatar_url
@@ -566,34 +1268,36 @@ class AutoRoles(Cog):
         self.role_cache[ctx.guild.id].add_role(role.id, thz)
         await ctx.send(f'Registered role "{role}" for {thz:,} Thz.')
 
+        holders = tuple(self.bot.get_role_member_ids(role) or ())
+        current = await self._fetch_thz(ctx.guild.id, holders)
+
         async with self.pool.acquire() as conn:
             async with conn.cursor() as cur:
-                for member in ctx.guild.members:
-                    if member.bot:
+                for member_id in holders:
+                    member = ctx.guild.get_member(member_id)
+                    if member is None or member.bot:
                         continue
 
+                    # members already holding the role are credited its THz
                     if (
                             self.role_cache[ctx.guild.id].find_highest_role_id(
                                 frozenset((r.id for r in member.roles))
                             )
                             == role.id
+                            and current.get(member.id, 0) < thz
                     ):
-                        if (
-                                self.thz_cache[ctx.guild.id].get(member.id, 0)
-                                < thz
-                        ):
-                            self.thz_cache[ctx.guild.id][member.id] = thz
-                            await self._update_user_thz(
-                                cur,
-                                ctx.guild.id,
-                                member.id,
-                            )
+                        current[member.id] = thz
+                        if member.id in self.thz_cache[ctx.guild.id]:
+                            self.thz_cache[ctx.guild.id].set(member.id, thz)
+                        await self._update_user_thz(
+                            cur,
+                            ctx.guild.id,
+                            member.id,
+                            thz,
+                        )
 
-                    await self._update_user_role(
-                        cur,
-                        ctx.guild,
-                        member,
-                    )
+        # the plan only touches members whose roles actually differ
+        await self._sweep_level(ctx.guild, thz, role)
 
     @autorole.command(name='remove')
     @has_permissions(manage_roles=True)
@@ -601,22 +1305,15 @@ class AutoRoles(Cog):
         """Remove a role from the autorole registration."""
 
         role = self.bot.convert_roles(ctx, role)[0]
+        thz = self.role_cache[ctx.guild.id].role_cache.get(role.id)
 
         await self._remove_roles(ctx.guild.id, role.id)
 
         await ctx.send(f'Unregistered role "{role}".')
 
-        async with self.pool.acquire() as conn:
-            async with conn.cursor() as cur:
-                for member in ctx.guild.members:
-                    if member.bot:
-                        continue
-
-                    await self._update_user_role(
-                        cur,
-                        ctx.guild,
-                        member,
-                    )
+        # holders keep the role, now unmanaged, so only its level moves
+        if thz is not None:
+            await self._sweep_level(ctx.guild, thz)
 
     @command(aliases=('setxp',))
     @has_permissions(manage_roles=True)
@@ -627,33 +1324,36 @@ class AutoRoles(Cog):
             await ctx.send("You can't have a negative THz!")
             return
 
-        self.thz_cache[ctx.guild.id][member.id] = thz
+        self.thz_cache[ctx.guild.id].set(member.id, thz)
         async with self.pool.acquire() as conn:
             async with conn.cursor() as cur:
-                await self._update_user_thz(cur, ctx.guild.id, member.id)
-                await self._update_user_role(cur, ctx.guild, member)
+                await self._update_user_thz(
+                    cur, ctx.guild.id, member.id, thz,
+                )
+                await self._update_user_role(cur, ctx.guild, member, thz)
 
         await ctx.send(f"{member.name}'s THz set to {thz:,} THz.")
 
 
 async def _setup(bot: Bot):
-    await bot.wait_until_ready()
-    try:
-        cog = AutoRoles(bot)
+    cog = AutoRoles(bot)
+    state = bot.fresnel_deps.take_state(__name__, STATE_VERSION)
+    if state is None:
         await cog._init()
-        log.info("adding AutoRoles cog")
-        bot.add_cog(cog)
-    except:  # noqa: E722
-        backup_flag.clear()
-        raise
+    else:
+        await cog.adopt_state(state)
+    log.info("adding AutoRoles cog")
+    bot.add_cog(cog)
+    bot.metrics.register_collector(__name__, cog.collect_metrics)
 
 
 def setup(bot: Bot):
     log.info("scheduling autoroles setup")
-    bot.loop.create_task(_setup(bot))
+    bot.fresnel_deps.start(__name__, _setup, REQUIRES, PROVIDES)
 
 
 def teardown(bot: Bot):
-    backup_flag.clear()
+    bot.fresnel_deps.stop(__name__)
+    bot.metrics.unregister_collector(__name__)
     log.info("removing AutoRoles cog")
     bot.remove_cog(AutoRoles.__name__)
@@ -12,11 +12,18 @@ from discord.ext.commands import (
     when_mentioned_or,
 )
 
+from fresnel.core.snapshot import WRITES_KEY
+
 
 log = logging.getLogger(__name__)
 
+REQUIRES = ('ready', 'redis', 'warm_state')
+PROVIDES = ()
+
 
 KEY_NAME = 'prefixes'
+STATE_VERSION = 1
+SNAPSHOT = True
 
 
 class PrefixManager(Cog):
@@ -45,6 +52,7 @@ class PrefixManager(Cog):
             for guild_id, prefixes in cache.items():
                 if guild_id in cleanup:
                     cleanup_tr.hdel(KEY_NAME, guild_id)
+                    cleanup_tr.incr(WRITES_KEY)
                 else:
                     try:
                         self.cache[int(guild_id)] = next(
@@ -52,9 +60,27 @@ class PrefixManager(Cog):
                         )
                     except StopIteration:
                         cleanup_tr.hdel(KEY_NAME, guild_id)
+                        cleanup_tr.incr(WRITES_KEY)
 
             await cleanup_tr.execute()
 
+        self._install_prefix()
+
+    def export_state(self):
+        return {'prefixes': self.cache}
+
+    async def adopt_state(self, state):
+        self.cache = state['prefixes']
+        self._install_prefix()
+
+    def collect_metrics(self):
+        self.bot.metrics.gauge(
+            'fresnel_cache_entries',
+            "Entries held in in-memory caches.",
+            ('cache',),
+        ).set(len(self.cache), cache='prefixes')
+
+    def _install_prefix(self):
         def get_prefix(bot: Bot, message: Message):
             prefixes = self.cache.get(message.guild.id)
             if prefixes:
@@ -103,6 +129,7 @@ class PrefixManager(Cog):
             ctx.guild.id,
             row.getvalue(),
         )
+        await self.redis.incr(WRITES_KEY)
 
         self.cache[ctx.guild.id] = new_prefixes
         await ctx.send("Added new prefix.")
@@ -143,22 +170,31 @@ class PrefixManager(Cog):
 
             del self.cache[ctx.guild.id]
 
+        await self.redis.incr(WRITES_KEY)
+
         await ctx.send("Prefix removed.")
 
 
 async def _setup(bot: Bot):
-    await bot.wait_until_ready()
     cog = PrefixManager(bot)
-    await cog._init()
+    state = bot.fresnel_deps.take_state(__name__, STATE_VERSION)
+    if state is None:
+        with bot.startup_trace.span(__name__, 'init'):
+            await cog._init()
+    else:
+        await cog.adopt_state(state)
     log.info("adding PrefixManager cog")
     bot.add_cog(cog)
+    bot.metrics.register_collector(__name__, cog.collect_metrics)
 
 
 def setup(bot: Bot):
     log.info("scheduling prefix setup")
-    bot.loop.create_task(_setup(bot))
+    bot.fresnel_deps.start(__name__, _setup, REQUIRES, PROVIDES)
 
 
 def teardown(bot: Bot):
+    bot.fresnel_deps.stop(__name__)
+    bot.metrics.unregister_collector(__name__)
     log.info("removing PrefixManager cog")
     bot.remove_cog(PrefixManager.__name__)
@@ -12,6 +12,9 @@ from discord.ext.commands import (
 
 log = logging.getLogger(__name__)
 
+REQUIRES = ('ready', 'redis')
+PROVIDES = ()
+
 KEY_NAME = 'reactroles'  # {guild_id,}
 GUILD_KEY = 'reactroles:{guild_id}'  # {message_id,}
 EMOJI_KEY = 'reactroles:{guild_id}:{message_id}'
@@ -59,18 +62,19 @@ class ReactRoles(Cog):
 
 
 async def _setup(bot: Bot):
-    await bot.wait_until_ready()
     cog = ReactRoles(bot)
-    await cog._init()
+    with bot.startup_trace.span(__name__, 'init'):
+        await cog._init()
     log.info("adding ReactRoles")
     bot.add_cog(cog)
 
 
 def setup(bot: Bot):
-    log.info("scheduling prefix setup")
-    bot.loop.create_task(_setup(bot))
+    log.info("scheduling reactroles setup")
+    bot.fresnel_deps.start(__name__, _setup, REQUIRES, PROVIDES)
 
 
 def teardown(bot: Bot):
+    bot.fresnel_deps.stop(__name__)
     log.info("removing ReactRoles cog")
     bot.remove_cog(ReactRoles.__name__)
@@ -2,11 +2,12 @@ import logging
 from functools import reduce
 from operator import attrgetter, or_
 
-from discord import Color, Embed, Role
+from discord import Color, Embed, Guild, Role
 from discord.ext.commands import (
     Bot,
     Cog,
     Context,
+    Paginator,
     command,
     group,
     has_permissions,
@@ -19,6 +20,11 @@ from fresnel.core.util import EmbedPaginator
 
 log = logging.getLogger(__name__)
 
+REQUIRES = ('ready', 'db', 'role_cache', 'warm_state')
+PROVIDES = ()
+STATE_VERSION = 1
+SNAPSHOT = True
+
 SCHEMA = '''
 CREATE TABLE IF NOT EXISTS "{name}" (
     role_id BIGINT NOT NULL,
@@ -34,43 +40,80 @@ class SelfRoles(Cog):
         self.Query = bot._db_Query
         self.tables = {}
         self.cache = {}
+        self.views = {}
 
     async def _init(self):
         for guild in self.bot.guilds:
-            name = f'selfroles-{guild.id}'
-            self.tables[guild.id] = table = Table(name)
+            with self.bot.startup_trace.span(__name__, 'init', guild.id):
+                await self._init_guild(guild)
+
+    def export_state(self):
+        return {'roles': self.cache}
+
+    async def adopt_state(self, state):
+        for guild in self.bot.guilds:
+            if guild.id not in state['roles']:
+                with self.bot.startup_trace.span(__name__, 'init', guild.id):
+                    await self._init_guild(guild)
+                continue
+
+            self.tables[guild.id] = Table(f'selfroles-{guild.id}')
+            self.cache[guild.id] = state['roles'][guild.id]
+
+            # roles deleted while the state was saved
+            cleanup = [
+                role_id
+                for role_id
+                in self.cache[guild.id]
+                if not guild.get_role(role_id)
+            ]
+            if cleanup:
+                await self._remove_roles(guild.id, *cleanup)
+
+    async def _init_guild(self, guild: Guild):
+        name = f'selfroles-{guild.id}'
+        self.tables[guild.id] = table = Table(name)
 
-            self.cache[guild.id] = set()
+        self.cache[guild.id] = set()
+        self.views.pop(guild.id, None)
 
-            async with self.pool.acquire() as conn:
-                async with conn.cursor() as cur:
-                    await cur.execute(
-                        SCHEMA.format(name=name)
-                    )
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(
+                    SCHEMA.format(name=name)
+                )
 
-                    await cur.execute(str(
-                        self.Query.from_(table).select(table.role_id)
-                    ))
+                await cur.execute(str(
+                    self.Query.from_(table).select(table.role_id)
+                ))
 
-                    cleanup = []
-                    async for role_id, in cur:
-                        role = guild.get_role(role_id)
+                cleanup = []
+                async for role_id, in cur:
+                    role = guild.get_role(role_id)
 
-                        if role:
-                            self.cache[guild.id].add(role.id)
-                        else:
-                            cleanup.append(role_id)
+                    if role:
+                        self.cache[guild.id].add(role.id)
+                    else:
+                        cleanup.append(role_id)
 
-                    if cleanup:
-                        await self._remove_roles(guild.id, *cleanup)
+                if cleanup:
+                    await self._remove_roles(guild.id, *cleanup)
 
-        await self.bot.fresnel_cache_flag.wait()
+    def collect_metrics(self):
+        entries = self.bot.metrics.gauge(
+            'fresnel_cache_entries',
+            "Entries held in in-memory caches.",
+            ('cache',),
+        )
+        entries.set(sum(map(len, self.cache.values())), cache='selfroles')
+        entries.set(len(self.views), cache='selfroles_views')
 
     async def on_guild_join(self, guild):
         name = f'selfroles-{guild.id}'
         self.tables[guild.id] = Table(name)
 
         self.cache[guild.id] = set()
+        self.views.pop(guild.id, None)
 
         async with self.pool.acquire() as conn:
             async with conn.cursor() as cur:
@@ -78,6 +121,9 @@ class SelfRoles(Cog):
                     SCHEMA.format(name=name)
                 )
 
+    async def on_guild_remove(self, guild):
+        self.views.pop(guild.id, None)
+
     @group()
     @has_permissions(manage_roles=True)
     async def roleman(self, ctx: Context):
@@ -105,6 +151,7 @@ class SelfRoles(Cog):
                         pass
                     else:
                         self.cache[ctx.guild.id].add(role.id)
+                        self.views.pop(ctx.guild.id, None)
 
         pages = EmbedPaginator(ctx, "Registered the following roles...",
                                color=Color.green())
@@ -128,6 +175,7 @@ class SelfRoles(Cog):
 
         for role_id in role_ids:
             self.cache[guild_id].discard(role_id)
+        self.views.pop(guild_id, None)
 
     @roleman.command(name='remove')
     async def roleman_remove(self, ctx: Context, *, roles):
@@ -148,33 +196,52 @@ class SelfRoles(Cog):
         if role.id in self.cache[role.guild.id]:
             await self._remove_roles(role.guild.id, role.id)
 
-    @command(aliases=('roles',))
-    async def listroles(self, ctx: Context):
-        """List all available selfroles."""
+    async def on_guild_role_update(self, before: Role, after: Role):
+        if (
+                after.id in self.cache.get(after.guild.id, ())
+                and (
+                    before.position != after.position
+                    or before.name != after.name
+                )
+        ):
+            self.views.pop(after.guild.id, None)
 
-        roles = self.cache.get(ctx.guild.id)
-        if not roles:
-            await ctx.send("No roles registered.")
-            return
+    def _get_view(self, guild):
+        view = self.views.get(guild.id)
+        if view is not None:
+            return view
 
         roles = sorted(
             (
                 role for role in (
-                    ctx.guild.get_role(role_id)
+                    guild.get_role(role_id)
                     for role_id
-                    in roles
+                    in self.cache.get(guild.id, ())
                 ) if role
             ),
             key=attrgetter('position'),
             reverse=True,
         )
 
-        pages = EmbedPaginator(ctx, "Available selfroles...")
+        paginator = Paginator(prefix='', suffix='', max_size=2048)
         for line, role in enumerate(roles, start=1):
-            pages.add_line(role.mention)
+            paginator.add_line(role.mention)
             if line % 15 == 0:
-                pages.close_page()
+                paginator.close_page()
+
+        self.views[guild.id] = view = tuple(paginator.pages) if roles else ()
+        return view
+
+    @command(aliases=('roles',))
+    async def listroles(self, ctx: Context):
+        """List all available selfroles."""
+
+        view = self._get_view(ctx.guild)
+        if not view:
+            await ctx.send("No roles registered.")
+            return
 
+        pages = EmbedPaginator(ctx, "Available selfroles...", pages=view)
         await pages.send_to()
 
     @command(aliases=('+', 'iam'))
@@ -242,7 +309,7 @@ class SelfRoles(Cog):
         """Check what users have a role."""
 
         role = self.bot.convert_roles(ctx, role)[0]
-        members = role.members
+        members = self.bot.get_role_members(role)
 
         if not members:
             await ctx.send(f'No members with role "{role}".')
@@ -258,18 +325,24 @@ class SelfRoles(Cog):
 
 
 async def _setup(bot: Bot):
-    await bot.wait_until_ready()
     cog = SelfRoles(bot)
-    await cog._init()
+    state = bot.fresnel_deps.take_state(__name__, STATE_VERSION)
+    if state is None:
+        await cog._init()
+    else:
+        await cog.adopt_state(state)
     log.info("adding SelfRoles cog")
     bot.add_cog(cog)
+    bot.metrics.register_collector(__name__, cog.collect_metrics)
 
 
 def setup(bot: Bot):
     log.info("scheduling selfroles setup")
-    bot.loop.create_task(_setup(bot))
+    bot.fresnel_deps.start(__name__, _setup, REQUIRES, PROVIDES)
 
 
 def teardown(bot: Bot):
+    bot.fresnel_deps.stop(__name__)
+    bot.metrics.unregister_collector(__name__)
     log.info("removing SelfRoles cog")
     bot.remove_cog(SelfRoles.__name__)
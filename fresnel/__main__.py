@@ -9,6 +9,9 @@ from pathlib import Path
 from discord.ext import commands
 
 from fresnel import config, constants
+from fresnel.logs import setup_logging
+from fresnel.core.deps import DependencyGraph
+from fresnel.core.startup import StartupTracer
 
 
 parser = argparse.ArgumentParser(
@@ -34,6 +37,13 @@ parser.add_argument(
     metavar='SNOWFLAKE_ID',
     dest='owner_id',
 )
+parser.add_argument(
+    '--trace-startup',
+    action='store_const',
+    const=True,
+    help="record startup timings and report them once ready",
+    dest='trace_startup',
+)
 parser.add_argument(
     '-v', '--verbose',
     action='store_true',
@@ -44,44 +54,35 @@ parser.add_argument(
 def main(cfg):
     """fresnel's main method"""
 
-    # colored logging
-    if cfg.get('log_colors', False, "use ANSI colored logging"):
-        for level, color in constants.LOGGING_COLORS:
-            name = logging.getLevelName(level)
-            logging.addLevelName(
-                level,
-                f'{color}{name}{constants.ANSI_RESET}',
-            )
-        format_str = constants.LOG_FORMAT_STR_COLOR
-    else:
-        format_str = constants.LOG_FORMAT_STR
-
-    # stdout StreamHandler
-    console_handler = logging.StreamHandler()
-    console_handler.setLevel(
-        logging.DEBUG
-        if cfg['verbose']
-        else logging.INFO
-    )
-    formatter = logging.Formatter(
-        fmt=format_str,
-        datefmt='%m-%d %H:%M:%S',
-        style='{',
-    )
-    console_handler.setFormatter(formatter)
+    startup_trace = StartupTracer(cfg.get(
+        'trace_startup', False,
+        "record startup timings and report them once ready",
+    ))
 
-    # set up the root logger
+    log_listener = setup_logging(cfg)
     log = logging.getLogger('')
-    log.setLevel(logging.DEBUG)
-    log.addHandler(console_handler)
 
     # check for a token
     token = cfg.get('token', "bot user application token")
     if not token:
         log.error("please add your bot token to your configuration "
                   "file or pass it via the command line")
+        if log_listener:
+            log_listener.stop()
         return
 
+    # optionally swap in a faster event loop before anything creates one
+    if cfg.get('use_uvloop', False,
+               "use uvloop as the event loop when it is installed"):
+        try:
+            import uvloop
+        except ImportError:
+            log.warning("uvloop is not installed, "
+                        "using the default event loop")
+        else:
+            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+            log.info("using uvloop event loop")
+
     # setup and run the bot
     bot = commands.Bot(
         command_prefix=commands.when_mentioned_or(
@@ -92,26 +93,66 @@ def main(cfg):
         owner_id=cfg.get('owner_id', comment="owner discord user ID"),
     )
     bot._config = cfg
+    bot.startup_trace = startup_trace
+    bot.fresnel_deps = DependencyGraph(bot)
 
     loop = asyncio.get_event_loop()
 
+    cfg.attach(loop)
+    cfg.add_listener(lambda changed: bot.dispatch('config_update', changed))
+    watch_interval = cfg.get(
+        'config_watch_interval', 5.0,
+        "seconds between checks for configuration file changes, 0 to disable",
+    )
+    if watch_interval:
+        cfg.watch(watch_interval)
+
     try:
+        bot.load_extension('fresnel.core.startup')
+        bot.load_extension('fresnel.core.metrics')
+        bot.load_extension('fresnel.core.tracing')
+        bot.load_extension('fresnel.core.monitor')
+        bot.load_extension('fresnel.core.scheduler')
+        bot.load_extension('fresnel.core.compute')
+        bot.load_extension('fresnel.core.rest')
         bot.load_extension('fresnel.core.error')
         bot.load_extension('fresnel.core.db')
+        bot.load_extension('fresnel.core.snapshot')
         bot.load_extension('fresnel.core.cache')
+        bot.load_extension('fresnel.core.profiler')
+        bot.load_extension('fresnel.core.recorder')
         bot.load_extension('fresnel.core.extman')
 
         loop.run_until_complete(bot.start(token))
+        if bot.fresnel_deps.fatal:
+            raise bot.fresnel_deps.fatal
     except (KeyboardInterrupt, Exception) as e:  # noqa: E722
+        # save caches while the extensions holding them are still loaded
+        if 'fresnel.core.snapshot' in bot.extensions:
+            try:
+                loop.run_until_complete(bot.warm_start.save())
+            except Exception:
+                log.exception("could not save the cache snapshot")
+
         for extension in tuple(bot.extensions):
             if extension.startswith('fresnel.core.'):
                 continue
             bot.unload_extension(extension)
 
         bot.unload_extension('fresnel.core.extman')
+        bot.unload_extension('fresnel.core.recorder')
+        bot.unload_extension('fresnel.core.profiler')
         bot.unload_extension('fresnel.core.cache')
+        bot.unload_extension('fresnel.core.snapshot')
         bot.unload_extension('fresnel.core.db')
         bot.unload_extension('fresnel.core.error')
+        bot.unload_extension('fresnel.core.rest')
+        bot.unload_extension('fresnel.core.compute')
+        bot.unload_extension('fresnel.core.scheduler')
+        bot.unload_extension('fresnel.core.monitor')
+        bot.unload_extension('fresnel.core.tracing')
+        bot.unload_extension('fresnel.core.metrics')
+        bot.unload_extension('fresnel.core.startup')
 
         loop.run_until_complete(bot.logout())
         if not isinstance(e, KeyboardInterrupt):
@@ -119,7 +160,10 @@ def main(cfg):
         else:
             log.info("Goodbye!")
     finally:
+        cfg.close()
         loop.close()
+        if log_listener:
+            log_listener.stop()
 
 
 if __name__ == '__main__':
@@ -1,13 +1,25 @@
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from io import StringIO
 from pathlib import Path
 
 from ruamel.yaml import YAML
+from ruamel.yaml.comments import CommentedMap
 
 from fresnel import constants
 
+log = logging.getLogger(__name__)
+
 yaml = YAML(typ='rt')
 
 
 class ConfigNamespace:
+    FLUSH_DELAY = 1.0
+
     def __init__(self, filepath: Path, args_namespace=None):
         self.args = args_namespace
 
@@ -15,6 +27,16 @@ class ConfigNamespace:
             filepath.touch(constants.FILE_MODE)
 
         self.config_filepath = filepath
+        # lock guards cfg and is taken on the event loop, so it is only
+        # held briefly; file_lock orders reads and writes of the file
+        self.lock = threading.RLock()
+        self.file_lock = threading.Lock()
+        self.loop = None
+        self.dirty = False
+        self.flush_handle = None
+        self.watch_task = None
+        self.listeners = []
+        self.mtime = None
         self.load_config()
 
     def __getitem__(self, key):
@@ -26,14 +48,16 @@ class ConfigNamespace:
     def __setitem__(self, key, value):
         if hasattr(self.args, key):
             delattr(self.args, key)
-        self.cfg[key] = value
-        self.save_config()
+        with self.lock:
+            self.cfg[key] = value
+            self._mark_dirty()
 
     def __delitem__(self, key):
         if hasattr(self.args, key):
             delattr(self.args, key)
-        del self.cfg[key]
-        self.save_config()
+        with self.lock:
+            del self.cfg[key]
+            self._mark_dirty()
 
     def __contains__(self, item):
         return hasattr(self.args, item) or (item in self.cfg)
@@ -42,21 +66,150 @@ class ConfigNamespace:
         try:
             return self[key]
         except KeyError:
-            self[key] = default
-            if comment:
-                self.comment(key, comment)
+            with self.lock:
+                self.cfg[key] = default
+                if comment:
+                    self.cfg.yaml_set_comment_before_after_key(
+                        key, before=comment)
+                self._mark_dirty()
             return default
 
     def comment(self, key, text):
-        self.cfg.yaml_set_comment_before_after_key(
-            key, before=text)
-        self.save_config()
+        with self.lock:
+            self.cfg.yaml_set_comment_before_after_key(
+                key, before=text)
+            self._mark_dirty()
 
     def load_config(self):
-        self.cfg = yaml.load(self.config_filepath)
-        if self.cfg is None:
-            self.cfg = {}
+        with self.lock:
+            self.cfg = self._read()
+            self.mtime = self._stat()
 
     def save_config(self):
-        yaml.dump(self.cfg, self.config_filepath)
-        self.load_config()
+        with self.lock:
+            self.dirty = True
+        self.flush()
+
+    def attach(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        if self.dirty:
+            self._schedule_flush()
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def watch(self, interval: float):
+        self.watch_task = self.loop.create_task(self._watch(interval))
+
+    def close(self):
+        if self.watch_task:
+            self.watch_task.cancel()
+        if self.flush_handle:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        self.flush()
+
+    def flush(self):
+        with self.file_lock:
+            with self.lock:
+                if not self.dirty:
+                    return
+                self.dirty = False
+
+                text = StringIO()
+                yaml.dump(self.cfg, text)
+
+            path = self.config_filepath
+            fd, tmp = tempfile.mkstemp(
+                dir=str(path.parent),
+                prefix=f'.{path.name}.',
+                suffix='.tmp',
+            )
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    f.write(text.getvalue())
+                if path.exists():
+                    shutil.copymode(str(path), tmp)
+                os.replace(tmp, str(path))
+            except:  # noqa: E722
+                self.dirty = True
+                try:
+                    os.unlink(tmp)
+                except FileNotFoundError:
+                    pass
+                raise
+
+            mtime = self._stat()
+            with self.lock:
+                self.mtime = mtime
+
+    def reload_changed(self):
+        with self.file_lock:
+            mtime = self._stat()
+            if mtime is None or mtime == self.mtime:
+                return {}
+            cfg = self._read()
+
+        with self.lock:
+            self.mtime = mtime
+
+            # keep pending writes the file does not know about yet
+            if self.dirty:
+                for key, value in self.cfg.items():
+                    if key not in cfg:
+                        cfg[key] = value
+
+            changed = {
+                key: cfg.get(key)
+                for key
+                in cfg.keys() | self.cfg.keys()
+                if cfg.get(key) != self.cfg.get(key)
+            }
+            self.cfg = cfg
+            return changed
+
+    def _mark_dirty(self):
+        self.dirty = True
+        if self.loop is not None and self.flush_handle is None:
+            self.flush_handle = self.loop.call_later(
+                self.FLUSH_DELAY, self._schedule_flush,
+            )
+
+    def _schedule_flush(self):
+        self.flush_handle = None
+        self.loop.run_in_executor(None, self._flush_background)
+
+    def _flush_background(self):
+        try:
+            self.flush()
+        except Exception as e:
+            log.error(f"could not write configuration: {e}")
+
+    async def _watch(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                changed = await self.loop.run_in_executor(
+                    None, self.reload_changed,
+                )
+            except Exception as e:
+                log.warning(f"could not reload configuration: {e}")
+                continue
+
+            if changed:
+                log.info("reloaded configuration keys: "
+                         f"{', '.join(map(str, changed))}")
+                for callback in self.listeners:
+                    callback(changed)
+
+    def _read(self):
+        cfg = yaml.load(self.config_filepath)
+        if cfg is None:
+            cfg = CommentedMap()
+        return cfg
+
+    def _stat(self):
+        try:
+            return self.config_filepath.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
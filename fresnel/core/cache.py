@@ -1,9 +1,8 @@
-import asyncio
 import logging
 import re
 import shlex
 
-from discord import Guild, Role
+from discord import Guild, Member, Role
 from discord.ext.commands import (
     BadArgument,
     Bot,
@@ -15,30 +14,130 @@ from discord.ext.commands import (
 
 log = logging.getLogger(__name__)
 
+REQUIRES = ('ready', 'redis')
+PROVIDES = ('role_cache',)
+STATE_VERSION = 2
+
 ID_MATCH = re.compile(r'([0-9]{15,21})$')
 ROLE_ID_MATCH = re.compile(r'<@&([0-9]+)>$')
 
 
+def _indexed_role_ids(member: Member):
+    # every member holds @everyone; lookups answer it from the guild
+    return frozenset(
+        role.id for role in member.roles if not role.is_default()
+    )
+
+
+class RoleMemberIndex:
+    def __init__(self, members=()):
+        self.role_members = {}
+
+        for member in members:
+            self.add_member(member)
+
+    def __contains__(self, role_id: int):
+        return role_id in self.role_members
+
+    def get(self, role_id: int):
+        return self.role_members.get(role_id, frozenset())
+
+    def count(self, role_id: int):
+        return len(self.role_members.get(role_id, ()))
+
+    def add_member(self, member: Member):
+        self._add(member.id, _indexed_role_ids(member))
+
+    def remove_member(self, member: Member):
+        self._remove(member.id, _indexed_role_ids(member))
+
+    def update_member(self, before: Member, after: Member):
+        before_ids = _indexed_role_ids(before)
+        after_ids = _indexed_role_ids(after)
+
+        self._remove(after.id, before_ids - after_ids)
+        self._add(after.id, after_ids - before_ids)
+
+    def remove_role(self, role_id: int):
+        self.role_members.pop(role_id, None)
+
+    def _add(self, member_id: int, role_ids):
+        for role_id in role_ids:
+            members = self.role_members.get(role_id)
+            if members is None:
+                self.role_members[role_id] = members = set()
+            members.add(member_id)
+
+    def _remove(self, member_id: int, role_ids):
+        for role_id in role_ids:
+            members = self.role_members.get(role_id)
+            if members is None:
+                continue
+            members.discard(member_id)
+            if not members:
+                del self.role_members[role_id]
+
+
 class CacheManager(Cog):
     def __init__(self, bot: Bot):
         self.bot = bot
         self.redis = bot.redis_pool
 
-        self.bot.fresnel_cache_flag = asyncio.Event()
         self.role_name_cache = {}
+        self.role_member_index = {}
 
         self.bot.convert_roles = self.convert_roles
+        self.bot.get_role_member_ids = self.get_role_member_ids
+        self.bot.get_role_members = self.get_role_members
+        self.bot.count_role_members = self.count_role_members
 
     async def _init(self):
         for guild in self.bot.guilds:
             self.role_name_cache[guild.id] = {
                 role.name.upper(): role.id for role in guild.roles
             }
+            self.role_member_index[guild.id] = RoleMemberIndex(
+                guild.members
+            )
+
+    def export_state(self):
+        return {
+            'names': self.role_name_cache,
+            'members': {
+                guild_id: index.role_members
+                for guild_id, index
+                in self.role_member_index.items()
+            },
+        }
 
-        self.bot.fresnel_cache_flag.set()
+    async def adopt_state(self, state):
+        for guild in self.bot.guilds:
+            if guild.id not in state['names']:
+                await self.on_guild_join(guild)
+                continue
 
-    def __unload(self):
-        self.bot.fresnel_cache_flag.clear()
+            self.role_name_cache[guild.id] = state['names'][guild.id]
+            self.role_member_index[guild.id] = index = RoleMemberIndex()
+            index.role_members = state['members'].get(guild.id, {})
+
+    def collect_metrics(self):
+        entries = self.bot.metrics.gauge(
+            'fresnel_cache_entries',
+            "Entries held in in-memory caches.",
+            ('cache',),
+        )
+        entries.set(
+            sum(map(len, self.role_name_cache.values())),
+            cache='role_names',
+        )
+        entries.set(
+            sum(
+                len(index.role_members)
+                for index
+                in self.role_member_index.values()
+            ),
+            cache='role_members',
+        )
 
     def convert_roles(self, ctx: Context, full_message: str):
         guild = ctx.message.guild
@@ -75,10 +174,50 @@ class CacheManager(Cog):
 
         return results
 
+    def get_role_member_ids(self, role: Role):
+        if role.is_default():
+            return frozenset(member.id for member in role.guild.members)
+        return self.role_member_index[role.guild.id].get(role.id)
+
+    def get_role_members(self, role: Role):
+        if role.is_default():
+            return list(role.guild.members)
+
+        guild = role.guild
+        return [
+            member for member in (
+                guild.get_member(member_id)
+                for member_id
+                in self.role_member_index[guild.id].get(role.id)
+            ) if member
+        ]
+
+    def count_role_members(self, role: Role):
+        if role.is_default():
+            return role.guild.member_count
+        return self.role_member_index[role.guild.id].count(role.id)
+
     async def on_guild_join(self, guild: Guild):
         self.role_name_cache[guild.id] = {
             role.name.upper(): role.id for role in guild.roles
         }
+        self.role_member_index[guild.id] = RoleMemberIndex(guild.members)
+
+    async def on_guild_remove(self, guild: Guild):
+        self.role_name_cache.pop(guild.id, None)
+        self.role_member_index.pop(guild.id, None)
+
+    async def on_member_join(self, member: Member):
+        self.role_member_index[member.guild.id].add_member(member)
+
+    async def on_member_remove(self, member: Member):
+        self.role_member_index[member.guild.id].remove_member(member)
+
+    async def on_member_update(self, before: Member, after: Member):
+        if before.roles != after.roles:
+            self.role_member_index[after.guild.id].update_member(
+                before, after,
+            )
 
     async def on_guild_role_update(self, before: Role, after: Role):
         if before.name != after.name:
@@ -95,20 +234,30 @@ class CacheManager(Cog):
     async def on_guild_role_create(self, role: Role):
         self.role_name_cache[role.guild.id][role.name.upper()] = role.id
 
+    async def on_guild_role_delete(self, role: Role):
+        self.role_member_index[role.guild.id].remove_role(role.id)
+
 
 async def _setup(bot: Bot):
-    await bot.wait_until_ready()
     cog = CacheManager(bot)
-    await cog._init()
+    state = bot.fresnel_deps.take_state(__name__, STATE_VERSION)
+    if state is None:
+        with bot.startup_trace.span(__name__, 'init'):
+            await cog._init()
+    else:
+        await cog.adopt_state(state)
     log.info("adding CacheManager cog")
     bot.add_cog(cog)
+    bot.metrics.register_collector(__name__, cog.collect_metrics)
 
 
 def setup(bot: Bot):
     log.info("scheduling cache setup")
-    bot.loop.create_task(_setup(bot))
+    bot.fresnel_deps.start(__name__, _setup, REQUIRES, PROVIDES)
 
 
 def teardown(bot: Bot):
+    bot.fresnel_deps.stop(__name__)
+    bot.metrics.unregister_collector(__name__)
     log.info("removing CacheManager cog")
     bot.remove_cog(CacheManager.__name__)
@@ -0,0 +1,85 @@
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+from discord.ext.commands import Bot, Cog
+
+
+log = logging.getLogger(__name__)
+
+
+# Jobs are plain module-level functions of immutable snapshots, so they
+# can run in worker processes as well as threads. Threads keep the loop
+# responsive between Python bytecodes, but a single long C call such as
+# sorting a huge list still holds the GIL; compute_processes avoids that
+# at the cost of pickling the snapshot.
+class Compute(Cog):
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self.loop = bot.loop
+
+        self.workers = bot._config.get(
+            'compute_workers', 2,
+            "worker threads or processes for CPU-heavy jobs",
+        )
+        self.processes = bot._config.get(
+            'compute_processes', False,
+            "run CPU-heavy jobs in worker processes instead of threads",
+        )
+        self.inline_below = bot._config.get(
+            'compute_inline_below', 2000,
+            "jobs over fewer items than this run directly on the loop",
+        )
+
+        if self.processes:
+            self.where = 'process'
+            self.executor = ProcessPoolExecutor(self.workers)
+        else:
+            self.where = 'thread'
+            self.executor = ThreadPoolExecutor(
+                self.workers, thread_name_prefix='fresnel-compute',
+            )
+
+        self.job_seconds = bot.metrics.histogram(
+            'fresnel_compute_seconds',
+            "Duration of offloaded jobs, including queueing.",
+            ('job', 'where'),
+        )
+
+        self.bot.compute = self
+
+    def cog_unload(self):
+        self.executor.shutdown(wait=False)
+
+    async def run(self, fn, *args, size: int = None):
+        """Run ``fn(*args)`` in the pool and return its result.
+
+        Small jobs, with ``size`` under compute_inline_below, are not
+        worth the hand-off and run inline.
+        """
+
+        inline = size is not None and size < self.inline_below
+        start = time.perf_counter()
+        try:
+            if inline:
+                return fn(*args)
+            return await self.loop.run_in_executor(
+                self.executor, partial(fn, *args),
+            )
+        finally:
+            self.job_seconds.observe(
+                time.perf_counter() - start,
+                job=fn.__name__,
+                where='inline' if inline else self.where,
+            )
+
+
+def setup(bot: Bot):
+    log.info("loading Compute cog")
+    bot.add_cog(Compute(bot))
+
+
+def teardown(bot: Bot):
+    log.info("removing Compute cog")
+    bot.remove_cog(Compute.__name__)
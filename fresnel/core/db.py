@@ -10,6 +10,9 @@ from fresnel import constants
 
 log = logging.getLogger(__name__)
 
+REQUIRES = ()
+PROVIDES = ('db', 'redis')
+
 
 class DBManager(Cog):
     REDIS_DEFAULT_DICT = {
@@ -82,16 +85,18 @@ class DBManager(Cog):
 
 async def _setup(bot: Bot):
     cog = DBManager(bot)
-    await cog._init()
+    with bot.startup_trace.span(__name__, 'init'):
+        await cog._init()
     log.info("adding DBManager cog")
     bot.add_cog(cog)
 
 
 def setup(bot: Bot):
-    log.info("running db setup until complete")
-    bot.loop.run_until_complete(_setup(bot))
+    log.info("scheduling db setup")
+    bot.fresnel_deps.start(__name__, _setup, REQUIRES, PROVIDES)
 
 
 def teardown(bot: Bot):
+    bot.fresnel_deps.stop(__name__)
     log.info("removing DBManager cog")
     bot.remove_cog(DBManager.__name__)
@@ -0,0 +1,200 @@
+import asyncio
+import logging
+
+from discord.ext.commands import Bot
+
+from fresnel.core.util import current_task
+
+
+log = logging.getLogger(__name__)
+
+
+class DependencyGraph:
+    READY = 'ready'
+
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self.capabilities = {}
+        self.providers = {}
+        self.tasks = {}
+        self.failed = set()
+        # a core provider failed, the bot cannot run without it
+        self.fatal = None
+        self.states = {}
+        self._waiting = {}
+
+        self.bot.loop.create_task(self._wait_ready())
+
+    def _event(self, name: str):
+        event = self.capabilities.get(name)
+        if event is None:
+            self.capabilities[name] = event = asyncio.Event()
+        return event
+
+    async def _wait_ready(self):
+        await self.bot.wait_until_ready()
+        self.provide(self.READY)
+
+    def is_provided(self, name: str):
+        return name in self.capabilities and self.capabilities[name].is_set()
+
+    def provide(self, name: str):
+        log.debug(f"capability '{name}' provided")
+        self._event(name).set()
+
+    def withdraw(self, name: str):
+        if name in self.capabilities:
+            self.capabilities[name].clear()
+
+    async def wait_for(self, *names: str):
+        for name in names:
+            await self._event(name).wait()
+
+    def start(self, ext: str, setup_fn, requires=(), provides=()):
+        for name in provides:
+            self.providers[name] = ext
+        self.failed.discard(ext)
+        self.tasks[ext] = self.bot.loop.create_task(
+            self._run(ext, setup_fn, requires, provides)
+        )
+
+    def stop(self, ext: str):
+        task = self.tasks.pop(ext, None)
+        if task:
+            task.cancel()
+            # stopped before it could take its stashed state
+            self.discard_state(ext)
+
+        for name, provider in tuple(self.providers.items()):
+            if provider == ext:
+                del self.providers[name]
+                self.withdraw(name)
+
+    def stash_state(self, ext: str, version: int, state):
+        self.states[ext] = (version, state)
+
+    def discard_state(self, ext: str):
+        if self.states.pop(ext, None) is not None:
+            log.info(f"discarded stashed state for '{ext}'")
+
+    def take_state(self, ext: str, version: int):
+        stashed = self.states.pop(ext, None)
+        if stashed is None:
+            return None
+        if stashed[0] != version:
+            log.info(f"discarding state for '{ext}': version {stashed[0]} "
+                     f"does not match {version}")
+            return None
+        return stashed[1]
+
+    def blocked(self):
+        return {
+            ext: [
+                name for name in requires
+                if not self.is_provided(name)
+            ]
+            for ext, requires
+            in self._waiting.items()
+        }
+
+    def _report_blocked(self, ext: str, provides):
+        # everything waiting on what the failed extension would have
+        # provided, directly or through another waiting extension
+        lost = set(provides)
+        blocked = set()
+        while True:
+            found = [
+                waiting
+                for waiting, requires
+                in self._waiting.items()
+                if waiting not in blocked and lost.intersection(requires)
+            ]
+            if not found:
+                break
+            for waiting in found:
+                blocked.add(waiting)
+                lost.update(
+                    name
+                    for name, provider
+                    in self.providers.items()
+                    if provider == waiting
+                )
+
+        for waiting in sorted(blocked):
+            log.error(f"extension '{waiting}' can not start until "
+                      f"'{ext}' is enabled again")
+
+    async def _run(self, ext: str, setup_fn, requires, provides):
+        trace = self.bot.startup_trace
+        self._waiting[ext] = requires
+        try:
+            with trace.span(ext, 'deps'):
+                await self.wait_for(*requires)
+            del self._waiting[ext]
+
+            await setup_fn(self.bot)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.failed.add(ext)
+            # a later manual enable must not adopt state this old
+            self.discard_state(ext)
+            log.exception(f"extension '{ext}' failed to initialise")
+            self._report_blocked(ext, provides)
+            if provides and ext.startswith('fresnel.core.'):
+                self.fatal = e
+                await self.bot.close()
+        else:
+            for name in provides:
+                self.provide(name)
+        finally:
+            self._waiting.pop(ext, None)
+            if self.tasks.get(ext) is current_task():
+                del self.tasks[ext]
+            trace.finish(ext)
+
+
+def load_order(graph: dict, provided=()):
+    """Topologically sort ``{ext: (requires, provides)}``.
+
+    Returns the load order, a mapping of extensions to capabilities that
+    nothing provides, and the extensions caught in dependency cycles."""
+
+    providers = {}
+    for ext, (requires, provides) in graph.items():
+        for name in provides:
+            providers[name] = ext
+
+    missing = {}
+    edges = {}
+    for ext, (requires, provides) in graph.items():
+        edges[ext] = set()
+        for name in requires:
+            if name in providers:
+                if providers[name] != ext:
+                    edges[ext].add(providers[name])
+            elif name not in provided:
+                missing.setdefault(ext, []).append(name)
+
+    order = []
+    done = set()
+    cyclic = set()
+    visiting = []
+
+    def visit(ext):
+        if ext in done:
+            return
+        if ext in visiting:
+            cyclic.update(visiting[visiting.index(ext):])
+            return
+        visiting.append(ext)
+        for dep in sorted(edges[ext]):
+            visit(dep)
+        visiting.pop()
+        done.add(ext)
+        order.append(ext)
+
+    for ext in sorted(graph):
+        visit(ext)
+
+    return [ext for ext in order if ext not in cyclic], missing, cyclic
@@ -1,4 +1,3 @@
-import asyncio
 import logging
 import sys
 import traceback
@@ -11,28 +10,129 @@ from discord.ext.commands import Bot, Context
 log = logging.getLogger(__name__)
 
 
+class ErrorAggregator:
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self.counts = {}
+        self.embed_times = {}
+        self.timer = None
+        self.load_config()
+
+    def load_config(self):
+        bot = self.bot
+        self.window = bot._config.get(
+            'error_window', 60.0,
+            "seconds over which repeated exceptions are summarized",
+        )
+        self.embed_interval = bot._config.get(
+            'error_embed_interval', 10.0,
+            "minimum seconds between error embeds sent to one channel",
+        )
+
+    async def on_config_update(self, changed):
+        self.load_config()
+
+    @staticmethod
+    def fingerprint(exception: Exception):
+        # commands wrap the actual failure in CommandInvokeError
+        exception = getattr(exception, 'original', exception)
+
+        tb = exception.__traceback__
+        if tb is None:
+            return (type(exception).__qualname__, None, None, None)
+
+        while tb.tb_next is not None:
+            tb = tb.tb_next
+        code = tb.tb_frame.f_code
+        return (
+            type(exception).__qualname__,
+            code.co_filename,
+            tb.tb_lineno,
+            code.co_name,
+        )
+
+    def report(self, where: str, exception: Exception):
+        key = self.fingerprint(exception)
+        entry = self.counts.get(key)
+        if entry is not None:
+            entry[0] += 1
+            entry[1] = where
+            return
+
+        self.counts[key] = [0, where]
+        tcb = ''.join(traceback.format_exception(
+            type(exception),
+            exception,
+            exception.__traceback__,
+        ))
+        log.warning(f"Exception in {where}:\n{tcb}")
+
+        if self.timer is None:
+            self.timer = self.bot.scheduler.call_later(
+                self.window, self.summarize,
+            )
+
+    def summarize(self):
+        self.timer = None
+
+        for key, entry in tuple(self.counts.items()):
+            repeats, where = entry
+            if not repeats:
+                # quiet for a whole window, log in full next time
+                del self.counts[key]
+                continue
+
+            name, filename, lineno, func = key
+            log.warning(f"{name} at {filename}:{lineno} in {func} repeated "
+                        f"{repeats} times in the last {self.window:g}s "
+                        f"(latest in {where})")
+            entry[0] = 0
+
+        now = self.bot.scheduler.time()
+        self.embed_times = {
+            channel_id: sent
+            for channel_id, sent
+            in self.embed_times.items()
+            if now - sent < self.embed_interval
+        }
+
+        if self.counts:
+            self.timer = self.bot.scheduler.call_later(
+                self.window, self.summarize,
+            )
+
+    def allow_embed(self, channel_id: int):
+        now = self.bot.scheduler.time()
+        sent = self.embed_times.get(channel_id)
+        if sent is not None and now - sent < self.embed_interval:
+            return False
+        self.embed_times[channel_id] = now
+        return True
+
+
 def setup(bot: Bot):
     log.info('registering on_error event')
 
+    aggregator = ErrorAggregator(bot)
+    bot.report_exception = aggregator.report
+    bot.add_listener(aggregator.on_config_update)
+
     @bot.event
     async def on_error(event: str, *args, **kwargs):
-        tcb = ''.join(traceback.format_exception(*sys.exc_info()))
-        log.warning(f"Exception in event {event}:\n{tcb}")
+        aggregator.report(f"event {event}", sys.exc_info()[1])
 
     @bot.event
     async def on_command_error(ctx: Context, exception: Exception):
         if ctx.command is None:
             msg = await ctx.send("No such command.")
-            await asyncio.sleep(5)
-            await msg.delete()
+            ctx.bot.scheduler.delete_later(msg, 5)
+            return
+
+        aggregator.report(f"command {ctx.command.name}", exception)
+
+        if not aggregator.allow_embed(ctx.channel.id):
             return
 
-        tcb = ''.join(traceback.format_exception(
-            type(exception),
-            exception,
-            exception.__traceback__,
-        ))
-        log.warning(f"Exception in command {ctx.command.name}:\n{tcb}")
         await ctx.send(embed=Embed(
             title=type(exception).__name__,
             description=str(exception),
@@ -1,11 +1,20 @@
+import importlib
 import logging
 from pathlib import Path
 
 from discord.ext.commands import Bot, Cog, Context, group, is_owner
 
+from fresnel.core.deps import DependencyGraph, load_order
+
 
 log = logging.getLogger(__name__)
 
+# core extensions that can be unloaded and loaded again while running;
+# the rest wrap bot internals or hold resources and last the process
+RELOADABLE_CORE = frozenset((
+    'fresnel.core.cache',
+))
+
 
 class ExtensionManager(Cog):
     def __init__(self, bot: Bot):
@@ -16,13 +25,39 @@ class ExtensionManager(Cog):
         ))
         self.ext_prefix = '.'.join(self.ext_dir.parts)
 
+        graph = {}
         for ext in self.ext_dir.iterdir():
             if ext.suffix == '.py':
                 path = '.'.join(ext.with_suffix('').parts)
-                log.info(f"attempting to load extension '{path}'")
-                bot.load_extension(path)
+                with bot.startup_trace.span(path, 'import'):
+                    module = importlib.import_module(path)
+                graph[path] = (
+                    getattr(module, 'REQUIRES', ()),
+                    getattr(module, 'PROVIDES', ()),
+                )
+
+        order, missing, cyclic = load_order(
+            graph,
+            provided=(
+                set(bot.fresnel_deps.providers)
+                | {DependencyGraph.READY}
+            ),
+        )
+        for path, names in missing.items():
+            log.warning(f"extension '{path}' requires capabilities nothing "
+                        f"provides: {', '.join(names)}")
+        if cyclic:
+            log.error("not loading extensions with cyclic dependencies: "
+                      f"{', '.join(sorted(cyclic))}")
+
+        for path in order:
+            log.info(f"attempting to load extension '{path}'")
+            bot.load_extension(path)
 
     def _get_name(self, ext_name):
+        # core extensions are addressed by their full module name
+        if ext_name in RELOADABLE_CORE:
+            return ext_name
         return f'{self.ext_prefix}.{ext_name}'
 
     @group(invoke_without_command=True)
@@ -33,6 +68,7 @@ class ExtensionManager(Cog):
         await ctx.send(await self.bot.get_help_message(ctx))
 
     @ext.command(name='enable')
+    @is_owner()
     async def ext_enable(self, ctx: Context, ext_name: str):
         """Load or enable an extension by name."""
 
@@ -45,6 +81,7 @@ class ExtensionManager(Cog):
             log.info(f"loaded extension {ext_name}")
 
     @ext.command(name='disable')
+    @is_owner()
     async def ext_disable(self, ctx: Context, ext_name: str):
         """Disable an extension by name."""
 
@@ -61,11 +98,30 @@ class ExtensionManager(Cog):
             return False
 
     @ext.command(name='reload')
+    @is_owner()
     async def ext_reload(self, ctx: Context, ext_name: str):
-        """Reload an extension by name."""
-
-        if await self.ext_disable.callback(self, ctx, ext_name):
-            await self.ext_enable.callback(self, ctx, ext_name)
+        """Reload an extension by name, keeping its in-memory state."""
+
+        name = self._get_name(ext_name)
+        module = self.bot.extensions.get(name)
+        version = getattr(module, 'STATE_VERSION', None)
+
+        if version is not None:
+            for cog in tuple(self.bot.cogs.values()):
+                if type(cog).__module__ == name:
+                    self.bot.fresnel_deps.stash_state(
+                        name, version, cog.export_state(),
+                    )
+                    log.info(f"exported state of extension {ext_name}")
+                    break
+
+        try:
+            if await self.ext_disable.callback(self, ctx, ext_name):
+                await self.ext_enable.callback(self, ctx, ext_name)
+        except Exception:
+            # nothing will come back for it
+            self.bot.fresnel_deps.discard_state(name)
+            raise
 
 
 def setup(bot: Bot):
@@ -0,0 +1,407 @@
+import asyncio
+import logging
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+import aiopg
+import aioredis
+from discord import HTTPException
+from discord.ext.commands import Bot, Cog
+
+from fresnel.core.util import current_task
+
+
+log = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(
+        '{}="{}"'.format(
+            name,
+            str(value).replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'),
+        )
+        for name, value
+        in pairs
+    ) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class Metric:
+    TYPE = None
+
+    def __init__(self, name: str, documentation: str, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def render(self):
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} {self.TYPE}'
+        for key, value in sorted(self.values.items()):
+            yield (f'{self.name}{_format_labels(self.labels, key)} '
+                   f'{_format_value(value)}')
+
+
+class Counter(Metric):
+    TYPE = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    TYPE = 'gauge'
+
+    def set(self, value, **labels):
+        self.values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    TYPE = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels=(),
+                 buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        entry = self.values.get(key)
+        if entry is None:
+            self.values[key] = entry = [[0] * len(self.buckets), 0.0, 0]
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            entry[0][index] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} {self.TYPE}'
+        for key, (counts, total, count) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, bucket in zip(self.buckets, counts):
+                cumulative += bucket
+                labels = _format_labels(
+                    self.labels, key, (('le', _format_value(bound)),),
+                )
+                yield f'{self.name}_bucket{labels} {cumulative}'
+            labels = _format_labels(self.labels, key, (('le', '+Inf'),))
+            yield f'{self.name}_bucket{labels} {count}'
+            labels = _format_labels(self.labels, key)
+            yield f'{self.name}_sum{labels} {_format_value(total)}'
+            yield f'{self.name}_count{labels} {count}'
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = {}
+        self.io_observers = []
+
+    def _get(self, cls, name, documentation, labels, **kwargs):
+        metric = self.metrics.get(name)
+        if metric is None:
+            self.metrics[name] = metric = cls(
+                name, documentation, labels, **kwargs,
+            )
+        elif not isinstance(metric, cls):
+            raise ValueError(f"metric {name} is already a {metric.TYPE}")
+        return metric
+
+    def counter(self, name: str, documentation: str, labels=()):
+        return self._get(Counter, name, documentation, labels)
+
+    def gauge(self, name: str, documentation: str, labels=()):
+        return self._get(Gauge, name, documentation, labels)
+
+    def histogram(self, name: str, documentation: str, labels=(),
+                  buckets=DEFAULT_BUCKETS):
+        return self._get(
+            Histogram, name, documentation, labels, buckets=buckets,
+        )
+
+    def observe_io(self, kind: str, seconds: float, task):
+        for observer in self.io_observers:
+            observer(kind, seconds, task)
+
+    @contextmanager
+    def waiting(self, kind: str = 'idle'):
+        """Report time the current task spends in this block as a wait."""
+
+        task = current_task()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_io(kind, time.perf_counter() - start, task)
+
+    def register_collector(self, owner: str, collector):
+        self.collectors[owner] = collector
+
+    def unregister_collector(self, owner: str):
+        self.collectors.pop(owner, None)
+
+    def render(self):
+        for owner, collector in tuple(self.collectors.items()):
+            try:
+                collector()
+            except Exception as e:
+                log.warning(f"metrics collector {owner} failed: {e}")
+
+        lines = []
+        for name in sorted(self.metrics):
+            lines.extend(self.metrics[name].render())
+        lines.append('')
+        return '\n'.join(lines)
+
+
+class RateLimitCounter(logging.Handler):
+    def __init__(self, counter: Counter):
+        super().__init__(logging.WARNING)
+        self.counter = counter
+
+    def emit(self, record):
+        if 'rate limited' in str(record.msg):
+            self.counter.inc()
+
+
+class MetricsServer(Cog):
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self.registry = bot.metrics = MetricsRegistry()
+        self.server = None
+
+        self.host = bot._config.get(
+            'metrics_host', '127.0.0.1',
+            "address the Prometheus metrics endpoint listens on",
+        )
+        self.port = bot._config.get(
+            'metrics_port', 9108,
+            "port of the Prometheus metrics endpoint, 0 to disable",
+        )
+
+        self.rest_requests = self.registry.counter(
+            'fresnel_rest_requests_total',
+            "Discord REST requests by route and response status.",
+            ('method', 'route', 'status'),
+        )
+        self.rest_seconds = self.registry.histogram(
+            'fresnel_rest_seconds',
+            "Discord REST request latency, including rate limit waits.",
+            ('method', 'route'),
+        )
+        self.rest_ratelimited = self.registry.counter(
+            'fresnel_rest_ratelimited_total',
+            "Discord REST responses with status 429.",
+        )
+        self.db_seconds = self.registry.histogram(
+            'fresnel_db_seconds',
+            "PostgreSQL statement latency.",
+        )
+        self.redis_seconds = self.registry.histogram(
+            'fresnel_redis_seconds',
+            "Redis command latency.",
+            ('command',),
+        )
+
+        self._install_probes()
+        self.registry.register_collector(__name__, self.collect)
+
+        if self.port:
+            self.task = bot.loop.create_task(self.start())
+        else:
+            self.task = None
+
+    def cog_unload(self):
+        self._remove_probes()
+        if self.task:
+            self.task.cancel()
+        if self.server:
+            self.server.close()
+
+    async def start(self):
+        self.server = await asyncio.start_server(
+            self.handle, self.host, self.port,
+        )
+        log.info(f"serving metrics on http://{self.host}:{self.port}/metrics")
+
+    async def handle(self, reader, writer):
+        try:
+            request = await reader.readline()
+            while (await reader.readline()).strip():
+                pass
+
+            parts = request.decode('latin-1').split()
+            if len(parts) >= 2 and parts[1].split('?')[0] == '/metrics':
+                status = '200 OK'
+                body = self.registry.render().encode()
+            else:
+                status = '404 Not Found'
+                body = b'not found\n'
+
+            writer.write(
+                f'HTTP/1.0 {status}\r\n'
+                'Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n'
+                f'Content-Length: {len(body)}\r\n'
+                '\r\n'.encode() + body
+            )
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def collect(self):
+        gauge = self.registry.gauge(
+            'fresnel_guilds', "Guilds the bot is a member of.",
+        )
+        gauge.set(len(self.bot.guilds))
+
+        scheduler = getattr(self.bot, 'scheduler', None)
+        if scheduler:
+            self.registry.gauge(
+                'fresnel_scheduled_timers', "Timers waiting in the scheduler.",
+            ).set(len(scheduler.timers))
+
+        paginators = getattr(self.bot, 'paginator_registry', None)
+        if paginators:
+            self.registry.gauge(
+                'fresnel_paginator_sessions', "Open paginator sessions.",
+            ).set(len(paginators.sessions))
+
+        monitor = self.bot.get_cog('LoopMonitor')
+        if monitor:
+            lag = self.registry.gauge(
+                'fresnel_loop_lag_seconds',
+                "Event loop scheduling lag percentiles.",
+                ('quantile',),
+            )
+            for name, value in monitor.lag_percentiles().items():
+                lag.set(value, quantile=name)
+
+    def _install_probes(self):
+        http = self.bot.http
+        self.http_request = http.request
+        request = self.http_request
+        registry = self.registry
+        rest_requests = self.rest_requests
+        rest_seconds = self.rest_seconds
+
+        async def timed_request(route, **kwargs):
+            task = current_task()
+            start = time.perf_counter()
+            status = 'ok'
+            try:
+                return await request(route, **kwargs)
+            except HTTPException as e:
+                status = str(e.status)
+                raise
+            except Exception:
+                status = 'error'
+                raise
+            finally:
+                elapsed = time.perf_counter() - start
+                registry.observe_io('rest', elapsed, task)
+                rest_seconds.observe(
+                    elapsed, method=route.method, route=route.path,
+                )
+                rest_requests.inc(
+                    method=route.method, route=route.path, status=status,
+                )
+
+        http.request = timed_request
+
+        self.ratelimit_handler = RateLimitCounter(self.rest_ratelimited)
+        logging.getLogger('discord.http').addHandler(self.ratelimit_handler)
+
+        self.cursor_execute = execute = aiopg.Cursor.execute
+        db_seconds = self.db_seconds
+
+        async def timed_execute(cursor, *args, **kwargs):
+            task = current_task()
+            start = time.perf_counter()
+            try:
+                return await execute(cursor, *args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                registry.observe_io('db', elapsed, task)
+                db_seconds.observe(elapsed)
+
+        aiopg.Cursor.execute = timed_execute
+
+        self.redis_execute = redis_execute = aioredis.RedisConnection.execute
+        redis_seconds = self.redis_seconds
+
+        def timed_redis_execute(conn, command, *args, **kwargs):
+            future = redis_execute(conn, command, *args, **kwargs)
+            task = current_task()
+            start = time.perf_counter()
+            name = (
+                command.decode('latin-1')
+                if isinstance(command, bytes)
+                else str(command)
+            ).upper()
+
+            def done(_):
+                elapsed = time.perf_counter() - start
+                registry.observe_io('redis', elapsed, task)
+                redis_seconds.observe(elapsed, command=name)
+
+            future.add_done_callback(done)
+            return future
+
+        aioredis.RedisConnection.execute = timed_redis_execute
+
+    def _remove_probes(self):
+        self.bot.http.request = self.http_request
+        logging.getLogger('discord.http').removeHandler(
+            self.ratelimit_handler
+        )
+        aiopg.Cursor.execute = self.cursor_execute
+        aioredis.RedisConnection.execute = self.redis_execute
+
+
+def setup(bot: Bot):
+    log.info("loading MetricsServer cog")
+    bot.add_cog(MetricsServer(bot))
+
+
+def teardown(bot: Bot):
+    log.info("removing MetricsServer cog")
+    bot.remove_cog(MetricsServer.__name__)
@@ -0,0 +1,171 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+from discord.ext.commands import Bot, Cog, Context, command, is_owner
+
+
+log = logging.getLogger(__name__)
+
+
+def percentile(ordered, fraction: float):
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(fraction * len(ordered)))
+    return ordered[index]
+
+
+class LoopMonitor(Cog):
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self.loop = bot.loop
+
+        self.interval = bot._config.get(
+            'loop_monitor_interval', 0.25,
+            "seconds between event loop lag measurements",
+        )
+        self.threshold = bot._config.get(
+            'loop_lag_threshold', 0.25,
+            "event loop lag in seconds that is reported as a stall",
+        )
+
+        self.samples = deque(maxlen=bot._config.get(
+            'loop_monitor_samples', 2400,
+            "number of event loop lag measurements kept",
+        ))
+        self.stalls = deque(maxlen=20)
+        self.events = deque(maxlen=8)
+        self.commands = {}
+
+        self.last_tick = time.monotonic()
+        self.stall_stack = None
+        self.loop_thread = threading.get_ident()
+
+        self.dispatch = bot.dispatch
+        bot.dispatch = self.recording_dispatch
+
+        self.stopped = threading.Event()
+        self.watchdog = threading.Thread(
+            target=self.watch,
+            name='fresnel-loop-watchdog',
+            daemon=True,
+        )
+        self.watchdog.start()
+        self.task = self.loop.create_task(self.run())
+
+    def cog_unload(self):
+        self.bot.dispatch = self.dispatch
+        self.task.cancel()
+        self.stopped.set()
+
+    def recording_dispatch(self, event_name, *args, **kwargs):
+        if not event_name.startswith('socket_'):
+            self.events.append(event_name)
+        return self.dispatch(event_name, *args, **kwargs)
+
+    async def on_command(self, ctx: Context):
+        self.commands[ctx.message.id] = ctx.command.qualified_name
+
+    async def on_command_completion(self, ctx: Context):
+        self.commands.pop(ctx.message.id, None)
+
+    async def on_command_error(self, ctx: Context, exception: Exception):
+        self.commands.pop(ctx.message.id, None)
+
+    async def run(self):
+        while True:
+            start = self.loop.time()
+            self.last_tick = time.monotonic()
+            await asyncio.sleep(self.interval)
+
+            lag = max(0.0, self.loop.time() - start - self.interval)
+            self.samples.append(lag)
+            if lag >= self.threshold:
+                self.report_stall(lag)
+
+    def watch(self):
+        reported = None
+        while not self.stopped.wait(self.interval):
+            tick = self.last_tick
+            if tick == reported:
+                continue
+            if time.monotonic() - tick < self.threshold + self.interval:
+                continue
+
+            # the loop is stuck right now, see what it is running
+            frame = sys._current_frames().get(self.loop_thread)
+            if frame is not None:
+                self.stall_stack = traceback.extract_stack(frame)
+            reported = tick
+
+    def report_stall(self, lag: float):
+        stack, self.stall_stack = self.stall_stack, None
+
+        stall = {
+            'lag': lag,
+            'time': time.time(),
+            'events': list(self.events),
+            'commands': sorted(set(self.commands.values())),
+            'stack': stack,
+        }
+        self.stalls.append(stall)
+
+        lines = [f"event loop stalled for {lag * 1000:.0f}ms"]
+        if stall['commands']:
+            lines.append(f"running commands: {', '.join(stall['commands'])}")
+        if stall['events']:
+            lines.append(f"recent events: {', '.join(stall['events'])}")
+        if stack:
+            lines.append("loop thread stack during the stall:")
+            lines.append(''.join(traceback.format_list(stack[-8:])).rstrip())
+        log.warning('\n'.join(lines))
+
+    def lag_percentiles(self):
+        ordered = sorted(self.samples)
+        return {
+            'p50': percentile(ordered, 0.50),
+            'p90': percentile(ordered, 0.90),
+            'p99': percentile(ordered, 0.99),
+            'max': ordered[-1] if ordered else 0.0,
+        }
+
+    @command(hidden=True)
+    @is_owner()
+    async def lag(self, ctx: Context):
+        """Show event loop lag percentiles and recent stalls."""
+
+        stats = self.lag_percentiles()
+        lines = [
+            f"Event loop: `{type(self.loop).__module__}."
+            f"{type(self.loop).__name__}`",
+            f"Lag over {len(self.samples)} samples: " + ', '.join(
+                f"{name} {value * 1000:.1f}ms"
+                for name, value
+                in stats.items()
+            ),
+        ]
+
+        for stall in list(self.stalls)[-5:]:
+            where = stall['commands'] or stall['events'][-3:] or ['unknown']
+            frame = stall['stack'][-1] if stall['stack'] else None
+            lines.append(
+                f"- {stall['lag'] * 1000:.0f}ms during {', '.join(where)}"
+                + (f" at `{frame.name}` ({frame.filename}:{frame.lineno})"
+                   if frame else '')
+            )
+
+        await ctx.send('\n'.join(lines))
+
+
+def setup(bot: Bot):
+    log.info("loading LoopMonitor cog")
+    bot.add_cog(LoopMonitor(bot))
+
+
+def teardown(bot: Bot):
+    log.info("removing LoopMonitor cog")
+    bot.remove_cog(LoopMonitor.__name__)
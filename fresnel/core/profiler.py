@@ -0,0 +1,201 @@
+import asyncio
+import cProfile
+import logging
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from io import BytesIO, StringIO
+
+from discord import File
+from discord.ext.commands import Bot, Cog, Context, group, is_owner
+
+
+log = logging.getLogger(__name__)
+
+
+class StackSampler(threading.Thread):
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(name='fresnel-stack-sampler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    f'{code.co_name} '
+                    f'({code.co_filename}:{code.co_firstlineno})'
+                )
+                frame = frame.f_back
+            self.stacks[tuple(reversed(stack))] += 1
+            self.samples += 1
+
+    def report(self, top: int):
+        own = Counter()
+        total = Counter()
+        for stack, count in self.stacks.items():
+            if stack:
+                own[stack[-1]] += count
+            for function in set(stack):
+                total[function] += count
+
+        out = StringIO()
+        out.write(f"{self.samples} samples every "
+                  f"{self.interval * 1000:.1f}ms\n\n")
+        for title, counts in (("self", own), ("inclusive", total)):
+            out.write(f"top functions by {title} samples:\n")
+            for function, count in counts.most_common(top):
+                share = 100 * count / max(1, self.samples)
+                out.write(f"{count:8d} {share:6.2f}% {function}\n")
+            out.write('\n')
+
+        out.write("collapsed stacks:\n")
+        for stack, count in self.stacks.most_common():
+            out.write(f"{';'.join(stack)} {count}\n")
+        return out.getvalue()
+
+
+class Profiler(Cog):
+    TOP = 40
+
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self.lock = asyncio.Lock()
+        self.loop_thread = threading.get_ident()
+        self.max_seconds = bot._config.get(
+            'profile_max_seconds', 300,
+            "longest duration allowed for a live profiling run",
+        )
+
+    async def _check_duration(self, ctx: Context, seconds: float):
+        if not 0 < seconds <= self.max_seconds:
+            await ctx.send(f"Duration must be between 0 and "
+                           f"{self.max_seconds} seconds.")
+            return False
+        if self.lock.locked():
+            await ctx.send("A profiling run is already in progress.")
+            return False
+        return True
+
+    async def _send_report(self, ctx: Context, name: str, report: str):
+        await ctx.send(file=File(
+            BytesIO(report.encode()),
+            filename=f'{name}-{int(time.time())}.txt',
+        ))
+
+    @group(invoke_without_command=True)
+    @is_owner()
+    async def profile(self, ctx: Context):
+        """Profile the running bot."""
+
+        await ctx.send(await self.bot.get_help_message(ctx))
+
+    @profile.command(name='cpu')
+    @is_owner()
+    async def profile_cpu(self, ctx: Context, seconds: float = 10.0):
+        """Run a deterministic profiler on the event loop."""
+
+        if not await self._check_duration(ctx, seconds):
+            return
+
+        async with self.lock:
+            await ctx.send(f"Profiling for {seconds:g} seconds...")
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                with self.bot.metrics.waiting():
+                    await asyncio.sleep(seconds)
+            finally:
+                profiler.disable()
+
+            out = StringIO()
+            stats = pstats.Stats(profiler, stream=out)
+            stats.sort_stats('cumulative').print_stats(self.TOP)
+            stats.sort_stats('tottime').print_stats(self.TOP)
+
+        await self._send_report(ctx, 'cpu', out.getvalue())
+
+    @profile.command(name='sample')
+    @is_owner()
+    async def profile_sample(self, ctx: Context, seconds: float = 10.0,
+                             interval_ms: float = 5.0):
+        """Sample the event loop's stack from a background thread."""
+
+        if not await self._check_duration(ctx, seconds):
+            return
+
+        async with self.lock:
+            await ctx.send(f"Sampling for {seconds:g} seconds...")
+            sampler = StackSampler(
+                self.loop_thread, max(0.001, interval_ms / 1000),
+            )
+            sampler.start()
+            try:
+                with self.bot.metrics.waiting():
+                    await asyncio.sleep(seconds)
+            finally:
+                sampler.stopped.set()
+            await self.bot.loop.run_in_executor(None, sampler.join)
+            report = await self.bot.loop.run_in_executor(
+                None, sampler.report, self.TOP,
+            )
+
+        await self._send_report(ctx, 'sample', report)
+
+    @profile.command(name='memory')
+    @is_owner()
+    async def profile_memory(self, ctx: Context, seconds: float = 10.0):
+        """Trace allocations made over a period of time."""
+
+        if not await self._check_duration(ctx, seconds):
+            return
+
+        async with self.lock:
+            await ctx.send(f"Tracing allocations for {seconds:g} seconds...")
+            started = not tracemalloc.is_tracing()
+            if started:
+                tracemalloc.start(25)
+            try:
+                before = tracemalloc.take_snapshot()
+                with self.bot.metrics.waiting():
+                    await asyncio.sleep(seconds)
+                after = tracemalloc.take_snapshot()
+                current, peak = tracemalloc.get_traced_memory()
+            finally:
+                if started:
+                    tracemalloc.stop()
+
+            out = StringIO()
+            out.write(f"traced memory: {current / 1024:.1f} KiB, "
+                      f"peak {peak / 1024:.1f} KiB\n\n")
+
+            out.write("top allocation growth by line:\n")
+            for stat in after.compare_to(before, 'lineno')[:self.TOP]:
+                out.write(f"{stat}\n")
+
+            out.write("\ntop allocation sites by traceback:\n")
+            for stat in after.statistics('traceback')[:10]:
+                out.write(f"{stat}\n")
+                for line in stat.traceback.format():
+                    out.write(f"{line}\n")
+
+        await self._send_report(ctx, 'memory', out.getvalue())
+
+
+def setup(bot: Bot):
+    log.info("loading Profiler cog")
+    bot.add_cog(Profiler(bot))
+
+
+def teardown(bot: Bot):
+    log.info("removing Profiler cog")
+    bot.remove_cog(Profiler.__name__)
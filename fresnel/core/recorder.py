@@ -0,0 +1,271 @@
+import asyncio
+import gzip
+import json
+import logging
+import secrets
+import string
+import time
+from hashlib import blake2b
+from pathlib import Path
+
+from discord.ext.commands import Bot, Cog, Context, group, is_owner
+
+
+log = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+FLUSH_INTERVAL = 2.0
+
+# the character classes AutoRoles scores message variety with
+SCORED_CHARS = frozenset(string.ascii_letters + string.punctuation)
+
+
+def _message_create(d, key):
+    author = d.get('author') or {}
+    content = d.get('content') or ''
+    chars = frozenset(content)
+    return {
+        'c': int(d['channel_id']),
+        'm': int(d['id']),
+        'u': int(author.get('id', 0)),
+        'b': bool(author.get('bot') or d.get('webhook_id')),
+        'r': [int(r) for r in (d.get('member') or {}).get('roles', ())],
+        # content is reduced to what the cogs score: its length, how many
+        # distinct scored characters it has and a keyed digest of its
+        # character set, so repeated messages still compare equal
+        'l': len(content),
+        'k': len(chars & SCORED_CHARS),
+        'h': blake2b(
+            ''.join(sorted(chars)).encode(), key=key, digest_size=8,
+        ).hexdigest(),
+    }
+
+
+def _member(d, key):
+    user = d.get('user') or {}
+    return {
+        'u': int(user['id']),
+        'b': bool(user.get('bot')),
+        'r': [int(r) for r in d.get('roles', ())],
+    }
+
+
+def _member_remove(d, key):
+    return {'u': int(d['user']['id'])}
+
+
+def _role(d, key):
+    role = d['role']
+    return {
+        'id': int(role['id']),
+        'n': role.get('name', ''),
+        'p': role.get('position', 0),
+    }
+
+
+def _role_delete(d, key):
+    return {'id': int(d['role_id'])}
+
+
+def _reaction(d, key):
+    emoji = d.get('emoji') or {}
+    return {
+        'c': int(d['channel_id']),
+        'm': int(d['message_id']),
+        'u': int(d['user_id']),
+        'e': emoji.get('name') if emoji.get('id') is None else emoji['id'],
+    }
+
+
+ENCODERS = {
+    'MESSAGE_CREATE': _message_create,
+    'GUILD_MEMBER_ADD': _member,
+    'GUILD_MEMBER_UPDATE': _member,
+    'GUILD_MEMBER_REMOVE': _member_remove,
+    'GUILD_ROLE_CREATE': _role,
+    'GUILD_ROLE_UPDATE': _role,
+    'GUILD_ROLE_DELETE': _role_delete,
+    'MESSAGE_REACTION_ADD': _reaction,
+    'MESSAGE_REACTION_REMOVE': _reaction,
+}
+
+
+class Recording:
+    def __init__(self, path: Path, header: dict):
+        self.path = path
+        self.key = secrets.token_bytes(16)
+        self.start = time.monotonic()
+        self.events = 0
+        self.buffer = [header]
+        self.file = None
+
+    def add(self, event: str, d: dict):
+        guild_id = d.get('guild_id')
+        if guild_id is None:
+            return
+
+        try:
+            data = ENCODERS[event](d, self.key)
+        except (KeyError, TypeError, ValueError) as e:
+            log.debug(f"skipping malformed {event} payload: {e}")
+            return
+
+        data['g'] = int(guild_id)
+        self.buffer.append(
+            [round(time.monotonic() - self.start, 3), event, data]
+        )
+        self.events += 1
+
+    def write(self, entries):
+        if self.file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.file = gzip.open(self.path, 'wt', encoding='utf-8')
+        for entry in entries:
+            self.file.write(json.dumps(entry, separators=(',', ':')))
+            self.file.write('\n')
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class GatewayRecorder(Cog):
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self.recording = None
+        self.task = None
+        self.directory = Path(bot._config.get(
+            'record_directory', 'recordings',
+            "directory gateway recordings are written to",
+        ))
+        self.max_seconds = bot._config.get(
+            'record_max_seconds', 3600,
+            "longest duration allowed for a gateway recording",
+        )
+
+    def cog_unload(self):
+        if self.task:
+            self.task.cancel()
+
+    def snapshot(self):
+        autoroles = self.bot.get_cog('AutoRoles')
+        selfroles = self.bot.get_cog('SelfRoles')
+        prefixes = self.bot.get_cog('PrefixManager')
+
+        guilds = []
+        for guild in self.bot.guilds:
+            entry = {
+                'id': guild.id,
+                'roles': [
+                    [role.id, role.name, role.position]
+                    for role
+                    in guild.roles
+                ],
+                'members': [
+                    [
+                        member.id,
+                        member.bot,
+                        [role.id for role in member.roles[1:]],
+                    ]
+                    for member
+                    in guild.members
+                ],
+            }
+            if autoroles and guild.id in autoroles.thz_cache:
+                entry['autoroles'] = list(
+                    autoroles.role_cache[guild.id].items()
+                )
+                entry['thz'] = list(autoroles.thz_cache[guild.id].items())
+            if selfroles and guild.id in selfroles.cache:
+                entry['selfroles'] = list(selfroles.cache[guild.id])
+            if prefixes and guild.id in prefixes.cache:
+                entry['prefixes'] = prefixes.cache[guild.id]
+            guilds.append(entry)
+
+        return {
+            'version': FORMAT_VERSION,
+            'time': time.time(),
+            'user_id': self.bot.user.id,
+            'guilds': guilds,
+        }
+
+    async def on_socket_response(self, msg):
+        recording = self.recording
+        if recording is not None and msg.get('t') in ENCODERS:
+            recording.add(msg['t'], msg['d'])
+
+    async def run(self, recording: Recording, seconds: float):
+        deadline = time.monotonic() + seconds
+        try:
+            while time.monotonic() < deadline and self.recording:
+                await asyncio.sleep(
+                    min(FLUSH_INTERVAL, max(0, deadline - time.monotonic()))
+                )
+                await self.flush(recording)
+        finally:
+            self.recording = None
+            await self.flush(recording)
+            await self.bot.loop.run_in_executor(None, recording.close)
+            log.info(f"recorded {recording.events} gateway events "
+                     f"to {recording.path}")
+
+    async def flush(self, recording: Recording):
+        entries, recording.buffer = recording.buffer, []
+        if entries:
+            await self.bot.loop.run_in_executor(
+                None, recording.write, entries,
+            )
+
+    @group(invoke_without_command=True, hidden=True)
+    @is_owner()
+    async def record(self, ctx: Context):
+        """Record gateway events for offline replay."""
+
+        if self.recording:
+            await ctx.send(f"Recording {self.recording.events} events "
+                           f"to `{self.recording.path}`.")
+        else:
+            await ctx.send(await self.bot.get_help_message(ctx))
+
+    @record.command(name='start')
+    @is_owner()
+    async def record_start(self, ctx: Context, seconds: float = 600.0):
+        """Start recording gateway events."""
+
+        if not 0 < seconds <= self.max_seconds:
+            await ctx.send(f"Duration must be between 0 and "
+                           f"{self.max_seconds} seconds.")
+            return
+        if self.recording or (self.task and not self.task.done()):
+            await ctx.send("A recording is already in progress.")
+            return
+
+        path = self.directory / f'gateway-{int(time.time())}.jsonl.gz'
+        self.recording = recording = Recording(path, self.snapshot())
+        self.task = self.bot.loop.create_task(self.run(recording, seconds))
+        await ctx.send(f"Recording for {seconds:g} seconds to `{path}`.")
+
+    @record.command(name='stop')
+    @is_owner()
+    async def record_stop(self, ctx: Context):
+        """Stop the current recording."""
+
+        recording, self.recording = self.recording, None
+        if recording is None:
+            await ctx.send("Not recording.")
+            return
+
+        await self.task
+        await ctx.send(f"Recorded {recording.events} events "
+                       f"to `{recording.path}`.")
+
+
+def setup(bot: Bot):
+    log.info("loading GatewayRecorder cog")
+    bot.add_cog(GatewayRecorder(bot))
+
+
+def teardown(bot: Bot):
+    log.info("removing GatewayRecorder cog")
+    bot.remove_cog(GatewayRecorder.__name__)
@@ -0,0 +1,174 @@
+import logging
+import time
+import weakref
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+from discord.ext.commands import Bot, Cog
+
+from fresnel.core.util import current_task
+
+
+log = logging.getLogger(__name__)
+
+
+class RESTScheduler(Cog):
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self.loop = bot.loop
+        self.background_tasks = weakref.WeakSet()
+        self.queues = OrderedDict()
+        self.queued = 0
+        self.active = 0
+        self.timer = None
+        self.load_config()
+
+        self.tokens = float(self.rate)
+        self.stamp = self.loop.time()
+
+        self.queue_seconds = bot.metrics.histogram(
+            'fresnel_rest_queue_seconds',
+            "Time background REST requests waited for budget.",
+        )
+        bot.metrics.register_collector(__name__, self.collect_metrics)
+
+        self.http_request = bot.http.request
+        bot.http.request = self.request
+        bot.rest_scheduler = self
+
+    def cog_unload(self):
+        self.bot.http.request = self.http_request
+        self.bot.metrics.unregister_collector(__name__)
+        if self.timer:
+            self.bot.scheduler.cancel(self.timer)
+        # let anything still queued through unscheduled
+        for queue in self.queues.values():
+            for waiter in queue:
+                if not waiter.done():
+                    waiter.set_result(None)
+        self.queues.clear()
+
+    def load_config(self):
+        bot = self.bot
+        self.rate = bot._config.get(
+            'rest_rate', 45.0,
+            "REST requests per second budgeted below Discord's global limit",
+        )
+        self.reserve = bot._config.get(
+            'rest_interactive_reserve', 10,
+            "requests of budget background work leaves for interactive use",
+        )
+        self.concurrency = bot._config.get(
+            'rest_background_concurrency', 4,
+            "background REST requests allowed in flight at once",
+        )
+
+    async def on_config_update(self, changed):
+        self.load_config()
+        self._pump()
+
+    @contextmanager
+    def background(self):
+        """Mark REST requests made by the current task as background."""
+
+        task = current_task()
+        if task in self.background_tasks:
+            yield
+            return
+
+        self.background_tasks.add(task)
+        try:
+            yield
+        finally:
+            self.background_tasks.discard(task)
+
+    def _refill(self):
+        now = self.loop.time()
+        self.tokens = min(
+            self.rate, self.tokens + (now - self.stamp) * self.rate,
+        )
+        self.stamp = now
+
+    async def request(self, route, **kwargs):
+        if current_task() not in self.background_tasks:
+            # interactive requests never wait here, but their spending
+            # holds background work back
+            self._refill()
+            self.tokens -= 1
+            return await self.http_request(route, **kwargs)
+
+        start = time.perf_counter()
+
+        key = getattr(route, 'guild_id', None) or getattr(
+            route, 'channel_id', None,
+        )
+        waiter = self.loop.create_future()
+        queue = self.queues.get(key)
+        if queue is None:
+            self.queues[key] = queue = deque()
+        queue.append(waiter)
+        self.queued += 1
+        self._pump()
+
+        try:
+            await waiter
+            self.queue_seconds.observe(time.perf_counter() - start)
+            return await self.http_request(route, **kwargs)
+        finally:
+            if waiter.done() and not waiter.cancelled():
+                self.active -= 1
+                self._pump()
+
+    def _pump(self):
+        self._refill()
+
+        while (
+                self.queues
+                and self.active < self.concurrency
+                and self.tokens - 1 >= self.reserve
+        ):
+            # round robin over guilds so one bulk job can't starve others
+            key, queue = self.queues.popitem(last=False)
+            waiter = queue.popleft()
+            self.queued -= 1
+            if queue:
+                self.queues[key] = queue
+
+            if waiter.done():
+                continue
+
+            self.tokens -= 1
+            self.active += 1
+            waiter.set_result(None)
+
+        if (
+                self.queues
+                and self.active < self.concurrency
+                and self.timer is None
+        ):
+            delay = (self.reserve + 1 - self.tokens) / self.rate
+            self.timer = self.bot.scheduler.call_later(delay, self._tick)
+
+    def _tick(self):
+        self.timer = None
+        self._pump()
+
+    def collect_metrics(self):
+        self.bot.metrics.gauge(
+            'fresnel_rest_queued',
+            "Background REST requests waiting for budget.",
+        ).set(self.queued)
+        self.bot.metrics.gauge(
+            'fresnel_rest_budget',
+            "REST requests currently left in the budget.",
+        ).set(self.tokens)
+
+
+def setup(bot: Bot):
+    log.info("loading RESTScheduler cog")
+    bot.add_cog(RESTScheduler(bot))
+
+
+def teardown(bot: Bot):
+    log.info("removing RESTScheduler cog")
+    bot.remove_cog(RESTScheduler.__name__)
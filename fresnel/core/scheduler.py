@@ -0,0 +1,157 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from heapq import heappop, heappush
+from itertools import count
+
+from discord import HTTPException, NotFound
+from discord.ext.commands import Bot, Cog
+
+
+log = logging.getLogger(__name__)
+
+
+class TimerHandle:
+    __slots__ = ('when', 'seq', 'callback', 'args', 'cancelled')
+
+    def __init__(self, when: float, seq: int, callback, args):
+        self.when = when
+        self.seq = seq
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def __lt__(self, other):
+        return (self.when, self.seq) < (other.when, other.seq)
+
+    def cancel(self):
+        self.cancelled = True
+        self.callback = self.args = None
+
+
+class Scheduler(Cog):
+    BULK_DELETE_LIMIT = 100
+    BULK_DELETE_WINDOW = 1.0
+    BULK_DELETE_MAX_AGE = timedelta(days=13, hours=23)
+
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self.loop = bot.loop
+        self.timers = []
+        self.seq = count()
+        self.cancelled = 0
+        self.wakeup = asyncio.Event()
+        self.deletes = {}
+
+        self.bot.scheduler = self
+        self.task = self.loop.create_task(self.run())
+
+    def cog_unload(self):
+        self.task.cancel()
+
+    def time(self):
+        return self.loop.time()
+
+    def call_later(self, delay: float, callback, *args):
+        return self.call_at(self.loop.time() + delay, callback, *args)
+
+    def call_at(self, when: float, callback, *args):
+        handle = TimerHandle(when, next(self.seq), callback, args)
+        heappush(self.timers, handle)
+        if self.timers[0] is handle:
+            self.wakeup.set()
+        return handle
+
+    def cancel(self, handle: TimerHandle):
+        if not handle.cancelled:
+            handle.cancel()
+            self.cancelled += 1
+
+            # drop dead entries once they dominate the heap
+            if self.cancelled > len(self.timers) // 2:
+                self.timers = [t for t in self.timers if not t.cancelled]
+                self.timers.sort()
+                self.cancelled = 0
+
+    def delete_later(self, message, delay: float):
+        return self.call_later(delay, self._queue_delete, message)
+
+    def _queue_delete(self, message):
+        channel = message.channel
+        batch = self.deletes.get(channel.id)
+        if batch is None:
+            self.deletes[channel.id] = batch = (channel, [])
+            self.call_later(
+                self.BULK_DELETE_WINDOW, self._flush_deletes, channel.id,
+            )
+        batch[1].append(message)
+
+    async def _flush_deletes(self, channel_id: int):
+        channel, messages = self.deletes.pop(channel_id)
+        with self.bot.rest_scheduler.background():
+            await self._delete_messages(channel, messages)
+
+    async def run(self):
+        while True:
+            now = self.loop.time()
+            while self.timers and self.timers[0].when <= now:
+                handle = heappop(self.timers)
+                if handle.cancelled:
+                    self.cancelled = max(0, self.cancelled - 1)
+                    continue
+                self._fire(handle)
+
+            self.wakeup.clear()
+            timeout = (
+                self.timers[0].when - self.loop.time()
+                if self.timers
+                else None
+            )
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _fire(self, handle: TimerHandle):
+        try:
+            result = handle.callback(*handle.args)
+            if asyncio.iscoroutine(result):
+                self.loop.create_task(result)
+        except Exception:
+            log.exception(f"scheduled callback {handle.callback!r} failed")
+
+    async def _delete_messages(self, channel, messages):
+        cutoff = datetime.utcnow() - self.BULK_DELETE_MAX_AGE
+        bulk = [msg for msg in messages if msg.created_at > cutoff]
+        single = [msg for msg in messages if msg.created_at <= cutoff]
+
+        if len(bulk) > 1 and hasattr(channel, 'delete_messages'):
+            for start in range(0, len(bulk), self.BULK_DELETE_LIMIT):
+                chunk = bulk[start:start + self.BULK_DELETE_LIMIT]
+                if len(chunk) == 1:
+                    single.extend(chunk)
+                    continue
+                try:
+                    await channel.delete_messages(chunk)
+                except HTTPException:
+                    single.extend(chunk)
+        else:
+            single.extend(bulk)
+
+        for msg in single:
+            try:
+                await msg.delete()
+            except NotFound:
+                pass
+            except HTTPException as e:
+                log.debug(f"could not delete message {msg.id}: {e}")
+
+
+def setup(bot: Bot):
+    log.info("loading Scheduler cog")
+    bot.add_cog(Scheduler(bot))
+
+
+def teardown(bot: Bot):
+    log.info("removing Scheduler cog")
+    bot.remove_cog(Scheduler.__name__)
@@ -0,0 +1,241 @@
+import json
+import logging
+import mmap
+import os
+import pickle
+import struct
+import sys
+import time
+from pathlib import Path
+
+from discord.ext.commands import Bot, Cog
+
+
+log = logging.getLogger(__name__)
+
+REQUIRES = ('db', 'redis')
+PROVIDES = ('warm_state',)
+
+MAGIC = b'FRSNSNAP'
+FORMAT_VERSION = 1
+PREAMBLE = struct.Struct('<8sII')
+
+# bumped by every Redis write to state a snapshot may hold
+WRITES_KEY = 'snapshot:writes'
+
+# every write to a snapshotted table bumps the generation from a
+# trigger, so no write path can forget to and nothing lags behind
+GENERATION_SCHEMA = """
+CREATE SEQUENCE IF NOT EXISTS fresnel_snapshot_generation;
+CREATE OR REPLACE FUNCTION fresnel_snapshot_bump() RETURNS trigger AS $$
+BEGIN
+    PERFORM nextval('fresnel_snapshot_generation');
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+"""
+
+SNAPSHOT_TABLES = """
+(relname LIKE 'thz-%'
+    OR relname LIKE 'autoroles-%'
+    OR relname LIKE 'selfroles-%')
+"""
+
+UNWATCHED_QUERY = f"""
+SELECT relname
+FROM pg_class AS c
+WHERE relkind = 'r' AND {SNAPSHOT_TABLES} AND NOT EXISTS (
+    SELECT 1
+    FROM pg_trigger
+    WHERE tgrelid = c.oid AND tgname = 'fresnel_snapshot'
+)
+"""
+
+TRIGGER_SCHEMA = """
+CREATE TRIGGER fresnel_snapshot
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON "{name}"
+FOR EACH STATEMENT EXECUTE PROCEDURE fresnel_snapshot_bump()
+"""
+
+# dropped and recreated tables change oid without any counted write
+WATERMARK_QUERY = f"""
+SELECT
+    (SELECT last_value FROM fresnel_snapshot_generation),
+    count(*),
+    coalesce(sum(oid::bigint), 0)
+FROM pg_class
+WHERE relkind = 'r' AND {SNAPSHOT_TABLES}
+"""
+
+
+class WarmStart(Cog):
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self.timer = None
+        self.path = Path(bot._config.get(
+            'snapshot_path', 'fresnel.snapshot',
+            "file in-memory caches are saved to for fast restarts",
+        ))
+        self.enabled = bot._config.get(
+            'warm_start', True,
+            "restore caches from the snapshot file when it is still valid",
+        )
+        self.interval = bot._config.get(
+            'snapshot_interval', 600.0,
+            "seconds between periodic cache snapshots, 0 to disable",
+        )
+
+        bot.warm_start = self
+        self._schedule()
+
+    def cog_unload(self):
+        if self.timer:
+            self.bot.scheduler.cancel(self.timer)
+
+    def _schedule(self):
+        if self.enabled and self.interval:
+            self.timer = self.bot.scheduler.call_later(
+                self.interval, self._periodic,
+            )
+
+    async def _periodic(self):
+        self.timer = None
+        try:
+            await self.save()
+        except Exception:
+            log.exception("periodic cache snapshot failed")
+        self._schedule()
+
+    async def _watch_tables(self):
+        async with self.bot._db_pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(GENERATION_SCHEMA)
+                await cur.execute(UNWATCHED_QUERY)
+                for name, in await cur.fetchall():
+                    await cur.execute(TRIGGER_SCHEMA.format(name=name))
+
+    async def watermark(self):
+        """A cheap fingerprint of everything the snapshot caches."""
+
+        async with self.bot._db_pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(WATERMARK_QUERY)
+                generation, tables, oids = await cur.fetchone()
+
+        version = await self.bot.redis_pool.get(WRITES_KEY)
+        return [generation, tables, int(oids), version]
+
+    async def save(self):
+        if not self.enabled:
+            return
+        if self.bot.fresnel_deps.tasks:
+            log.debug("not saving a snapshot while extensions are starting")
+            return
+
+        # read before exporting: a write landing in between makes the
+        # snapshot look stale, never the other way around
+        await self._watch_tables()
+        watermark = await self.watermark()
+
+        states = []
+        for cog in tuple(self.bot.cogs.values()):
+            module = sys.modules.get(type(cog).__module__)
+            if not getattr(module, 'SNAPSHOT', False):
+                continue
+            states.append((
+                module.__name__,
+                module.STATE_VERSION,
+                pickle.dumps(cog.export_state(), pickle.HIGHEST_PROTOCOL),
+            ))
+
+        start = time.perf_counter()
+        await self.bot.loop.run_in_executor(
+            None, self._write, watermark, states,
+        )
+        log.info(f"saved cache snapshot of {len(states)} extensions in "
+                 f"{time.perf_counter() - start:.2f}s")
+
+    def _write(self, watermark, states):
+        extensions = {}
+        offset = 0
+        for name, version, data in states:
+            extensions[name] = [version, offset, len(data)]
+            offset += len(data)
+
+        header = json.dumps({
+            'created': time.time(),
+            'watermark': watermark,
+            'extensions': extensions,
+        }).encode()
+
+        temp = self.path.with_name(self.path.name + '.tmp')
+        with temp.open('wb') as f:
+            f.write(PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header)))
+            f.write(header)
+            for _, _, data in states:
+                f.write(data)
+        os.replace(temp, self.path)
+
+    def _read(self, watermark):
+        with self.path.open('rb') as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            magic, version, length = PREAMBLE.unpack_from(mm)
+            if magic != MAGIC or version != FORMAT_VERSION:
+                log.info("ignoring snapshot with an unknown format")
+                return {}
+
+            base = PREAMBLE.size + length
+            header = json.loads(mm[PREAMBLE.size:base].decode())
+            if header['watermark'] != watermark:
+                log.info("ignoring snapshot, the databases changed since "
+                         "it was saved")
+                return {}
+
+            states = {}
+            with memoryview(mm) as view:
+                for name, (version, offset, size) in (
+                        header['extensions'].items()
+                ):
+                    start = base + offset
+                    with view[start:start + size] as data:
+                        states[name] = (version, pickle.loads(data))
+            return states
+
+    async def load(self):
+        if not self.enabled or not self.path.exists():
+            return
+
+        start = time.perf_counter()
+        states = await self.bot.loop.run_in_executor(
+            None, self._read, await self.watermark(),
+        )
+        for name, (version, state) in states.items():
+            # nothing would ever take the state of an unloaded extension
+            if name in self.bot.extensions:
+                self.bot.fresnel_deps.stash_state(name, version, state)
+        if states:
+            log.info(f"restored {len(states)} extension states from the "
+                     f"snapshot in {time.perf_counter() - start:.2f}s")
+
+
+async def _setup(bot: Bot):
+    cog = WarmStart(bot)
+    try:
+        with bot.startup_trace.span(__name__, 'load'):
+            await cog.load()
+    except Exception:
+        # a bad snapshot only costs a cold start
+        log.exception("could not load the cache snapshot")
+    log.info("adding WarmStart cog")
+    bot.add_cog(cog)
+
+
+def setup(bot: Bot):
+    log.info("scheduling snapshot setup")
+    bot.fresnel_deps.start(__name__, _setup, REQUIRES, PROVIDES)
+
+
+def teardown(bot: Bot):
+    bot.fresnel_deps.stop(__name__)
+    log.info("removing WarmStart cog")
+    bot.remove_cog(WarmStart.__name__)
@@ -0,0 +1,155 @@
+import importlib
+import logging
+import sys
+import time
+from contextlib import contextmanager
+from io import BytesIO
+
+from discord import File
+from discord.ext.commands import Bot, Cog, Context, command, is_owner
+
+
+log = logging.getLogger(__name__)
+
+
+class StartupTracer:
+    BAR_WIDTH = 40
+
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+        self.origin = time.perf_counter()
+        self.spans = []
+        self.pending = set()
+        self.report = None
+
+    @contextmanager
+    def span(self, ext: str, phase: str, detail=None):
+        if not self.enabled:
+            yield
+            return
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.spans.append((
+                ext, phase, detail,
+                start - self.origin,
+                time.perf_counter() - self.origin,
+            ))
+
+    def begin(self, ext: str):
+        if self.enabled and self.report is None:
+            self.pending.add(ext)
+
+    def finish(self, ext: str):
+        if ext not in self.pending:
+            return
+
+        self.pending.discard(ext)
+        if not self.pending:
+            self.report = self.format_report()
+            log.info(f"startup complete\n{self.report}")
+
+    def format_report(self):
+        phases = {}
+        for ext, phase, detail, start, end in self.spans:
+            key = (ext, phase)
+            entry = phases.get(key)
+            if entry is None:
+                phases[key] = entry = [start, end, 0.0, []]
+            entry[0] = min(entry[0], start)
+            entry[1] = max(entry[1], end)
+            entry[2] += end - start
+            if detail is not None:
+                entry[3].append((end - start, detail))
+
+        if not phases:
+            return "no startup spans recorded"
+
+        total = max(entry[1] for entry in phases.values())
+        scale = self.BAR_WIDTH / total if total else 0
+        width = max(len(f'{ext} {phase}') for ext, phase in phases)
+
+        lines = [
+            f"time to ready: {total:.3f}s",
+            '',
+            f"{'span':<{width}}  {'start':>8} {'wall':>8} {'busy':>8}",
+        ]
+        for (ext, phase), (start, end, busy, details) in sorted(
+                phases.items(), key=lambda item: item[1][0]):
+            offset = int(start * scale)
+            length = max(1, int((end - start) * scale))
+            lines.append(
+                f"{ext + ' ' + phase:<{width}}  "
+                f"{start:8.3f} {end - start:8.3f} {busy:8.3f}  "
+                f"{' ' * offset}{'#' * length}"
+            )
+            if len(details) > 1:
+                details.sort(reverse=True)
+                slowest = ', '.join(
+                    f"{detail} {duration:.3f}s"
+                    for duration, detail
+                    in details[:3]
+                )
+                lines.append(
+                    f"{'':<{width}}  {len(details)} spans, slowest: {slowest}"
+                )
+
+        return '\n'.join(lines)
+
+
+class StartupProfiler(Cog):
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self.tracer = bot.startup_trace
+        self.load_extension = bot.load_extension
+        bot.load_extension = self.traced_load_extension
+
+    def cog_unload(self):
+        self.bot.load_extension = self.load_extension
+
+    def traced_load_extension(self, name: str):
+        self.tracer.begin(name)
+        # the extension manager imports cogs up front to read their
+        # dependencies, a second span would stretch over the others
+        if name not in sys.modules:
+            with self.tracer.span(name, 'import'):
+                importlib.import_module(name)
+        with self.tracer.span(name, 'setup'):
+            self.load_extension(name)
+
+        # the dependency graph reports completion of scheduled setups
+        if name not in self.bot.fresnel_deps.tasks:
+            self.tracer.finish(name)
+
+    @command(hidden=True)
+    @is_owner()
+    async def startup(self, ctx: Context):
+        """Show the startup timing report."""
+
+        if not self.tracer.enabled:
+            await ctx.send("Startup tracing is disabled.")
+            return
+
+        if self.tracer.report is None:
+            await ctx.send("Still starting up, waiting on: "
+                           f"`{'`, `'.join(sorted(self.tracer.pending))}`")
+            return
+
+        await ctx.send(file=File(
+            BytesIO(self.tracer.report.encode()),
+            filename='startup.txt',
+        ))
+
+
+def setup(bot: Bot):
+    if not hasattr(bot, 'startup_trace'):
+        bot.startup_trace = StartupTracer(False)
+    log.info("loading StartupProfiler cog")
+    bot.add_cog(StartupProfiler(bot))
+
+
+def teardown(bot: Bot):
+    log.info("removing StartupProfiler cog")
+    bot.remove_cog(StartupProfiler.__name__)
@@ -0,0 +1,196 @@
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from discord.ext.commands import Bot, Cog, Context, command, is_owner
+
+from fresnel.core.monitor import percentile
+from fresnel.core.util import current_task
+
+
+log = logging.getLogger(__name__)
+
+IO_SPANS = ('db', 'redis', 'rest')
+# deliberate waits, such as sleeping through a profiling run
+WAIT_SPANS = IO_SPANS + ('idle',)
+SPANS = ('cpu',) + WAIT_SPANS
+
+
+class Trace:
+    __slots__ = ('name', 'start', 'waits')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = time.perf_counter()
+        self.waits = dict.fromkeys(WAIT_SPANS, 0.0)
+
+
+class Tracer(Cog):
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self.stacks = {}
+        self.samples = {}
+        self.load_config()
+
+        self.metrics = getattr(bot, 'metrics', None)
+        if self.metrics:
+            self.metrics.io_observers.append(self.observe_io)
+            self.invocation_seconds = self.metrics.histogram(
+                'fresnel_invocation_seconds',
+                "Wall time of commands and event listeners.",
+                ('name',),
+            )
+            self.span_seconds = self.metrics.counter(
+                'fresnel_invocation_span_seconds_total',
+                "Time commands and event listeners spent per span.",
+                ('name', 'span'),
+            )
+
+        self.run_event = bot._run_event
+        self.invoke = bot.invoke
+        bot._run_event = self.traced_run_event
+        bot.invoke = self.traced_invoke
+
+    def cog_unload(self):
+        self.bot._run_event = self.run_event
+        self.bot.invoke = self.invoke
+        if self.metrics:
+            self.metrics.io_observers.remove(self.observe_io)
+
+    def load_config(self):
+        bot = self.bot
+        self.slow_threshold = bot._config.get(
+            'trace_slow_threshold', 1.0,
+            "seconds after which a command or listener is logged as slow",
+        )
+        self.sample_count = bot._config.get(
+            'trace_samples', 512,
+            "number of timings kept per command or listener",
+        )
+
+    async def on_config_update(self, changed):
+        self.load_config()
+
+    async def traced_run_event(self, coro, event_name, *args, **kwargs):
+        if event_name.startswith('socket_'):
+            return await self.run_event(coro, event_name, *args, **kwargs)
+
+        name = getattr(coro, '__qualname__', event_name)
+        with self.trace(name):
+            await self.run_event(coro, event_name, *args, **kwargs)
+
+    async def traced_invoke(self, ctx: Context):
+        if ctx.command is None:
+            return await self.invoke(ctx)
+
+        with self.trace(ctx.command.qualified_name):
+            await self.invoke(ctx)
+
+    @contextmanager
+    def trace(self, name: str):
+        task = current_task()
+        stack = self.stacks.setdefault(task, [])
+        trace = Trace(name)
+        stack.append(trace)
+        try:
+            yield trace
+        finally:
+            stack.pop()
+            if not stack:
+                del self.stacks[task]
+            self.record(trace, time.perf_counter() - trace.start)
+
+    def observe_io(self, kind: str, seconds: float, task):
+        # nested traces (a command inside on_message) all wait on it
+        for trace in self.stacks.get(task, ()):
+            trace.waits[kind] += seconds
+
+    def record(self, trace: Trace, wall: float):
+        spans = dict(trace.waits)
+        # whatever was not spent waiting on I/O or idle ran on (or
+        # queued for) the event loop
+        spans['cpu'] = max(0.0, wall - sum(spans.values()))
+        # idle time is not the caller's latency
+        wall -= spans['idle']
+
+        samples = self.samples.get(trace.name)
+        if samples is None or samples.maxlen != self.sample_count:
+            samples = self.samples[trace.name] = deque(
+                samples or (), maxlen=self.sample_count,
+            )
+        samples.append((wall, spans))
+
+        if self.metrics:
+            self.invocation_seconds.observe(wall, name=trace.name)
+            for span, seconds in spans.items():
+                if seconds:
+                    self.span_seconds.inc(seconds, name=trace.name, span=span)
+
+        if wall >= self.slow_threshold:
+            log.warning(
+                f"slow {trace.name}: {wall * 1000:.0f}ms ("
+                + ', '.join(
+                    f"{span} {spans[span] * 1000:.0f}ms"
+                    for span in SPANS
+                ) + ')'
+            )
+
+    def percentiles(self, name: str):
+        samples = self.samples.get(name, ())
+        ordered = sorted(wall for wall, _ in samples)
+        stats = {
+            'p50': percentile(ordered, 0.50),
+            'p90': percentile(ordered, 0.90),
+            'p99': percentile(ordered, 0.99),
+            'max': ordered[-1] if ordered else 0.0,
+        }
+        for span in SPANS:
+            stats[span] = (
+                sum(spans[span] for _, spans in samples)
+                / max(1, len(samples))
+            )
+        return stats
+
+    @command(hidden=True)
+    @is_owner()
+    async def latency(self, ctx: Context, name: str = None):
+        """Show latency percentiles of commands and listeners."""
+
+        if name is not None:
+            names = [name] if name in self.samples else []
+        else:
+            names = sorted(
+                self.samples,
+                key=lambda name: self.percentiles(name)['p90'],
+                reverse=True,
+            )[:15]
+
+        if not names:
+            await ctx.send("No timings recorded.")
+            return
+
+        lines = []
+        for name in names:
+            stats = self.percentiles(name)
+            lines.append(
+                f"`{name}` ({len(self.samples[name])}): " + ', '.join(
+                    f"{key} {stats[key] * 1000:.1f}ms"
+                    for key in ('p50', 'p90', 'p99', 'max')
+                ) + " | mean " + ', '.join(
+                    f"{span} {stats[span] * 1000:.1f}ms"
+                    for span in SPANS
+                )
+            )
+
+        await ctx.send('\n'.join(lines))
+
+
+def setup(bot: Bot):
+    log.info("loading Tracer cog")
+    bot.add_cog(Tracer(bot))
+
+
+def teardown(bot: Bot):
+    log.info("removing Tracer cog")
+    bot.remove_cog(Tracer.__name__)
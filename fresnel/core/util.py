@@ -1,16 +1,20 @@
 import asyncio
 import logging
+import time
 from collections import OrderedDict
 from enum import IntEnum
-from functools import partial
 
-from discord import Embed
+from discord import Embed, Forbidden
 from discord.abc import Messageable
-from discord.ext.commands import Context, Paginator
+from discord.ext.commands import Bot, Context, Paginator
 
 
 log = logging.getLogger(__name__)
 
+current_task = getattr(asyncio, 'current_task', None)
+if current_task is None:
+    current_task = asyncio.Task.current_task
+
 
 class EmbedPaginator:
     class Navigation(IntEnum):
@@ -26,13 +30,29 @@ class EmbedPaginator:
         ('⏭', Navigation.LAST),
     ))
 
-    def __init__(self, ctx: Context, base_title: str, color=None):
+    def __init__(self, ctx: Context, base_title: str, color=None,
+                 pages=None):
         self.ctx = ctx
         self.title = base_title
         self.attrs = {}
         if color:
             self.attrs['color'] = color
         self.paginator = Paginator(prefix='', suffix='', max_size=2048)
+        self._pages = pages
+
+    @property
+    def pages(self):
+        if self._pages is not None:
+            return self._pages
+        return self.paginator.pages
+
+    @staticmethod
+    async def _page(pages, index: int):
+        # page sources load pages on demand instead of holding them all
+        fetch = getattr(pages, 'fetch', None)
+        if fetch is not None:
+            return await fetch(index)
+        return pages[index]
 
     def add_line(self, line='', *, empty=False):
         self.paginator.add_line(line, empty=empty)
@@ -40,23 +60,11 @@ class EmbedPaginator:
     def close_page(self):
         self.paginator.close_page()
 
-    def _check(self, page, pages, reaction, user):
-        reaction = reaction.emoji
-        if user.id != self.ctx.author.id:
-            return False
-        if reaction not in self.EMOJIS:
-            return False
-        if page == 1 and self.EMOJIS[reaction] <= self.Navigation.BACK:
-            return False
-        if page == pages and self.EMOJIS[reaction] >= self.Navigation.NEXT:
-            return False
-        return True
-
     async def send_to(self, dest: Messageable = None):
         if not dest:
             dest = self.ctx
 
-        pages = self.paginator.pages
+        pages = self.pages
         page = 1
 
         title = self.title
@@ -65,7 +73,7 @@ class EmbedPaginator:
 
         msg = await dest.send(embed=Embed(
             title=title,
-            description=pages[page - 1],
+            description=await self._page(pages, page - 1),
             **self.attrs,
         ))
 
@@ -75,30 +83,195 @@ class EmbedPaginator:
         for emoji in self.EMOJIS:
             await msg.add_reaction(emoji)
 
+        registry = PaginatorRegistry.get(self.ctx.bot)
+        session = registry.open(msg.id, self.ctx.author.id, len(pages))
+
+        # navigation can run for as long as the paginator is open, so it
+        # gets its own task rather than holding up the command
+        self.ctx.bot.loop.create_task(
+            self._navigate(registry, session, msg, pages, page)
+        )
+
+    async def _navigate(self, registry, session, msg, pages, shown: int):
+        try:
+            await self._run_session(registry, session, msg, pages, shown)
+        except Exception:
+            log.exception(f"paginator {msg.id} failed")
+
+    async def _run_session(self, registry, session, msg, pages, shown: int):
         try:
-            while True:
-                check = partial(self._check, page, len(pages))
-                reaction, user = await self.ctx.bot.wait_for(
-                    'reaction_add',
-                    check=check,
-                    timeout=30.0,
-                )
-
-                action = self.EMOJIS[reaction.emoji]
-                if action is self.Navigation.FIRST:
-                    page = 1
-                elif action is self.Navigation.BACK:
-                    page -= 1
-                elif action is self.Navigation.NEXT:
-                    page += 1
-                elif action is self.Navigation.LAST:
-                    page = len(pages)
+            closed = False
+            while not closed:
+                action = await session.queue.get()
+                if action is None:
+                    break
+
+                session.navigate(action)
+                closed = session.drain()
+                if session.page == shown:
+                    continue
+
+                delay = session.reserve(registry.edit_rate, registry.edit_per)
+                if delay:
+                    await asyncio.sleep(delay)
+                    closed = session.drain() or closed
+                    if session.page == shown:
+                        continue
 
+                shown = session.page
                 await msg.edit(embed=Embed(
-                    title=f'{self.title} ({page}/{len(pages)})',
-                    description=pages[page - 1],
+                    title=f'{self.title} ({shown}/{len(pages)})',
+                    description=await self._page(pages, shown - 1),
                     **self.attrs,
                 ))
-        except asyncio.TimeoutError:
+        finally:
+            registry.close(session)
+
+        try:
+            await msg.clear_reactions()
+        except Forbidden:
             for emoji in self.EMOJIS:
                 await msg.remove_reaction(emoji, msg.author)
+
+
+class PaginatorSession:
+    __slots__ = (
+        'message_id', 'author_id', 'page', 'page_count', 'queue',
+        'tokens', 'stamp', 'deadline', 'timer',
+    )
+
+    def __init__(self, message_id: int, author_id: int, page_count: int):
+        self.message_id = message_id
+        self.author_id = author_id
+        self.page = 1
+        self.page_count = page_count
+        self.queue = asyncio.Queue()
+        self.tokens = None
+        self.stamp = time.monotonic()
+        self.deadline = None
+        self.timer = None
+
+    def drain(self):
+        """Apply all pending navigation; return True if closed."""
+
+        while not self.queue.empty():
+            action = self.queue.get_nowait()
+            if action is None:
+                return True
+            self.navigate(action)
+        return False
+
+    def reserve(self, rate: int, per: float):
+        """Spend one edit from the budget; return seconds to wait."""
+
+        now = time.monotonic()
+        if self.tokens is None:
+            self.tokens = rate
+        else:
+            self.tokens = min(
+                rate, self.tokens + (now - self.stamp) * rate / per,
+            )
+        self.stamp = now
+
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0
+        return -self.tokens * per / rate
+
+    def navigate(self, action):
+        Navigation = EmbedPaginator.Navigation
+
+        if action is Navigation.FIRST:
+            page = 1
+        elif action is Navigation.BACK:
+            page = self.page - 1
+        elif action is Navigation.NEXT:
+            page = self.page + 1
+        else:
+            page = self.page_count
+
+        page = max(1, min(page, self.page_count))
+        if page == self.page:
+            return None
+
+        self.page = page
+        return page
+
+
+class PaginatorRegistry:
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self.sessions = OrderedDict()
+        self.load_config()
+
+        bot.add_listener(self.on_raw_reaction_add)
+        bot.add_listener(self.on_config_update)
+
+    def load_config(self):
+        bot = self.bot
+        self.max_sessions = bot._config.get(
+            'paginator_max_sessions', 500,
+            "maximum number of simultaneously active paginators",
+        )
+        self.timeout = bot._config.get(
+            'paginator_timeout', 30.0,
+            "seconds of inactivity before a paginator stops listening",
+        )
+        self.edit_rate = bot._config.get(
+            'paginator_edit_rate', 3,
+            "page edits allowed per paginator in each edit period",
+        )
+        self.edit_per = bot._config.get(
+            'paginator_edit_per', 5.0,
+            "length in seconds of a paginator's edit period",
+        )
+
+    @classmethod
+    def get(cls, bot: Bot):
+        registry = getattr(bot, 'paginator_registry', None)
+        if registry is None:
+            bot.paginator_registry = registry = cls(bot)
+        return registry
+
+    def open(self, message_id: int, author_id: int, page_count: int):
+        while self.sessions and len(self.sessions) >= self.max_sessions:
+            _, oldest = self.sessions.popitem(last=False)
+            oldest.queue.put_nowait(None)
+
+        session = PaginatorSession(message_id, author_id, page_count)
+        session.deadline = self.bot.scheduler.time() + self.timeout
+        session.timer = self.bot.scheduler.call_at(
+            session.deadline, self._expire, session,
+        )
+        self.sessions[message_id] = session
+        return session
+
+    def close(self, session: PaginatorSession):
+        if self.sessions.get(session.message_id) is session:
+            del self.sessions[session.message_id]
+        if session.timer:
+            self.bot.scheduler.cancel(session.timer)
+            session.timer = None
+
+    def _expire(self, session: PaginatorSession):
+        session.timer = None
+        if session.deadline > self.bot.scheduler.time():
+            # activity pushed the deadline back since this timer was set
+            session.timer = self.bot.scheduler.call_at(
+                session.deadline, self._expire, session,
+            )
+        else:
+            session.queue.put_nowait(None)
+
+    async def on_config_update(self, changed):
+        self.load_config()
+
+    async def on_raw_reaction_add(self, payload):
+        session = self.sessions.get(payload.message_id)
+        if session is None or payload.user_id != session.author_id:
+            return
+
+        action = EmbedPaginator.EMOJIS.get(str(payload.emoji))
+        if action is not None:
+            session.deadline = self.bot.scheduler.time() + self.timeout
+            session.queue.put_nowait(action)
@@ -0,0 +1,118 @@
+import json
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+from fresnel import constants
+
+
+DATE_FORMAT = '%m-%d %H:%M:%S'
+
+
+class ColorFormatter(logging.Formatter):
+    LEVEL_NAMES = {
+        level: f'{color}{logging.getLevelName(level)}{constants.ANSI_RESET}'
+        for level, color
+        in constants.LOGGING_COLORS
+    }
+
+    def formatMessage(self, record):
+        levelname = record.levelname
+        record.levelname = self.LEVEL_NAMES.get(record.levelno, levelname)
+        try:
+            return super().formatMessage(record)
+        finally:
+            record.levelname = levelname
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': record.created,
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry['stack'] = self.formatStack(record.stack_info)
+        return json.dumps(entry)
+
+
+class DeferredQueueHandler(QueueHandler):
+    def prepare(self, record):
+        # merge args now, leave traceback formatting to the listener
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def setup_logging(cfg):
+    """Configure the root logger; return a listener to stop on exit."""
+
+    level = logging.DEBUG if cfg['verbose'] else logging.INFO
+    log_format = cfg.get(
+        'log_format', 'text',
+        "log record format, either text or json",
+    )
+
+    if log_format == 'json':
+        stream_formatter = file_formatter = JSONFormatter()
+    else:
+        file_formatter = logging.Formatter(
+            fmt=constants.LOG_FORMAT_STR,
+            datefmt=DATE_FORMAT,
+            style='{',
+        )
+        if cfg.get('log_colors', False, "use ANSI colored logging"):
+            stream_formatter = ColorFormatter(
+                fmt=constants.LOG_FORMAT_STR_COLOR,
+                datefmt=DATE_FORMAT,
+                style='{',
+            )
+        else:
+            stream_formatter = file_formatter
+
+    handlers = []
+
+    if cfg.get('log_console', True, "write log records to the console"):
+        # stdout StreamHandler
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(stream_formatter)
+        handlers.append(console_handler)
+
+    log_file = cfg.get('log_file', None, "path of a file to append logs to")
+    if log_file:
+        file_handler = logging.FileHandler(log_file, encoding='utf-8')
+        file_handler.setFormatter(file_formatter)
+        handlers.append(file_handler)
+
+    # set up the root logger; records below this level are never created
+    root = logging.getLogger('')
+    root.setLevel(level)
+
+    levels = cfg.get(
+        'log_levels', {},
+        "per-logger minimum levels, e.g. {discord: INFO}",
+    )
+    for name, logger_level in (levels or {}).items():
+        logging.getLogger(name).setLevel(
+            logger_level.upper()
+            if isinstance(logger_level, str)
+            else logger_level
+        )
+
+    if not cfg.get(
+            'log_queue', False,
+            "hand log records to a background thread for writing",
+    ):
+        for handler in handlers:
+            root.addHandler(handler)
+        return None
+
+    records = queue.Queue()
+    root.addHandler(DeferredQueueHandler(records))
+    listener = QueueListener(records, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener